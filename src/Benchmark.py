@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import tempfile
+import time
+import z3
+from run import parse_program, analyze_program
+from Profile import Profile
+from Portfolio import Portfolio
+from Loops import UNROLL
+from Search import SEARCH_STRATEGIES
+
+# bump when the generated workloads or the recorded fields change; results of
+# different versions are not compared
+BENCHMARK_VERSION = 1
+
+
+# ============================ Workload generators ============================
+# every generator returns the source of a module in the dialect run.py accepts:
+# annotated int parameters, annotated locals and lists, plain calls of the
+# functions of the module. The output only depends on the size
+
+# ifs nested size deep, one parameter per level; the innermost test
+# contradicts the outermost one, so one path is infeasible
+def gen_nested(size):
+    params = ', '.join('a%d: int' % i for i in range(size))
+    lines = ['def nested(%s):' % params]
+    for i in range(size):
+        lines.append('%sif a%d > %d:' % ('    ' * (i + 1), i, i))
+    indent = '    ' * (size + 1)
+    lines.append('%sif a0 < 0:' % indent)
+    lines.append('%s    return -1' % indent)
+    for i in reversed(range(size + 1)):
+        lines.append('%sreturn %d' % ('    ' * (i + 1), i))
+    return '\n'.join(lines) + '\n'
+
+
+# if/elif chain of size branches on one parameter; the last branch is dead
+def gen_fanout(size):
+    lines = ['def fanout(a: int, b: int):']
+    for i in range(size):
+        lines.append('    %s a == %d:' % ('if' if i == 0 else 'elif', i))
+        lines.append('        return b + %d' % i)
+    lines.append('    elif a < 0 and a > %d:' % size)
+    lines.append('        return b')
+    lines.append('    else:')
+    lines.append('        return a')
+    return '\n'.join(lines) + '\n'
+
+
+# loop of size iterations followed by a branch on the updated variables
+def gen_loop(size):
+    return '\n'.join([
+        'def loop(a: int, b: int):',
+        '    for i in range(%d):' % size,
+        '        a += 1',
+        '        b -= 1',
+        '    if a > b:',
+        '        return a',
+        '    elif a == a + 1:',
+        '        return b',
+        '    return 0',
+    ]) + '\n'
+
+
+# list of size elements, indexed on every branch
+def gen_list(size):
+    size = min(size, 10)
+    lines = [
+        'def lists(a: int, b: int) -> int:',
+        '    test: list[int] = [%s]' % ', '.join(str(i) for i in range(size)),
+        '    test[0] = a',
+    ]
+    for i in range(1, size):
+        lines.append('    %s test[0] > test[%d] + b:' % ('if' if i == 1 else 'elif', i))
+        lines.append('        return test[%d]' % i)
+    lines.append('    return b')
+    return '\n'.join(lines) + '\n'
+
+
+# chain of size functions, each calling the next one in a branch
+def gen_call_chain(size):
+    lines = []
+    for i in range(size):
+        lines.append('def chain_%d(a: int):' % i)
+        if i < size - 1:
+            lines.append('    if chain_%d(a):' % (i + 1))
+            lines.append('        return a > %d' % i)
+            lines.append('    return False')
+        else:
+            lines.append('    if a > %d:' % i)
+            lines.append('        return True')
+            lines.append('    return False')
+        lines.append('')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+# size conditionals in a row, each only assigning a value; the last test
+# cannot hold, since s is at most size
+def gen_sequence(size):
+    params = ', '.join('a%d: int' % i for i in range(size))
+    lines = ['def sequence(%s):' % params, '    s: int = 0']
+    for i in range(size):
+        lines.append('    if a%d > %d:' % (i, i))
+        lines.append('        s = s + 1')
+        lines.append('    else:')
+        lines.append('        s = s - 1')
+    lines.append('    if s > %d:' % size)
+    lines.append('        return -1')
+    lines.append('    return s')
+    return '\n'.join(lines) + '\n'
+
+
+# size conditionals in a row, each on a parameter of its own, so the paths
+# split into independent clusters; a parameter above its bound is clipped to
+# it, so the last test cannot hold
+def gen_independent(size):
+    params = ', '.join('a%d: int' % i for i in range(size))
+    lines = ['def independent(%s):' % params]
+    for i in range(size):
+        lines.append('    if a%d > %d:' % (i, i))
+        lines.append('        a%d = %d' % (i, i))
+    lines.append('    if a%d > %d:' % (size - 1, size - 1))
+    lines.append('        return -1')
+    lines.append('    return 0')
+    return '\n'.join(lines) + '\n'
+
+
+# one callee called from size callers with constant arguments; the callers
+# passing at most 10 cannot take their true branch
+def gen_constant_call(size):
+    lines = [
+        'def callee(c: int):',
+        '    if c > 10:',
+        '        return True',
+        '    return False',
+        '',
+        '',
+    ]
+    for i in range(size):
+        lines.append('def caller_%d(a: int):' % i)
+        lines.append('    if callee(%d):' % (i * 7))
+        lines.append('        return a')
+        lines.append('    return 0')
+        lines.append('')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+GENERATORS = {
+    'nested': gen_nested,
+    'fanout': gen_fanout,
+    'loop': gen_loop,
+    'list': gen_list,
+    'sequence': gen_sequence,
+    'call_chain': gen_call_chain,
+    'constant_call': gen_constant_call,
+    'independent': gen_independent,
+}
+
+# (generator, size) of the default suite
+DEFAULT_SUITE = [
+    ('nested', 2), ('nested', 4), ('nested', 6),
+    ('fanout', 4), ('fanout', 8), ('fanout', 16),
+    ('loop', 2), ('loop', 5), ('loop', 10),
+    ('list', 3), ('list', 6), ('list', 10),
+    ('sequence', 2), ('sequence', 4), ('sequence', 6),
+    ('call_chain', 2), ('call_chain', 4),
+    ('constant_call', 2), ('constant_call', 4),
+    ('independent', 2), ('independent', 4), ('independent', 6),
+]
+
+
+def parse_suite(specs):
+    suite = []
+    for spec in specs:
+        name, _, size = spec.partition(':')
+        if name not in GENERATORS or not size.isdigit():
+            raise ValueError('workload must be NAME:SIZE with NAME one of %s: %s' % (', '.join(GENERATORS), spec))
+        suite.append((name, int(size)))
+    return suite
+
+
+# ============================ Measurement ============================
+# peak resident set size of this process in kB; None where resource is missing
+def peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kB
+    return rss // 1024 if platform.system() == 'Darwin' else rss
+
+
+# analyze one function in a fresh process, so that its peak RSS, z3 context and
+# summaries are its own
+def measure_function(task):
+    program, index, options = task
+    max_depth, max_tries, max_iter, summaries, prune, workers, merge, search, portfolio, simplify, partition, inputs, unroll = options
+    start = time.perf_counter()
+    module = parse_program(program, unroll)
+    profile = Profile()
+    analyze_program(module, index, max_depth, max_tries, max_iter, summaries, prune=prune, workers=workers, quiet=True, profile=profile, merge=merge, search=search, inputs=inputs, unroll=unroll,
+                   portfolio=Portfolio(portfolio) if portfolio is not None else None, simplify=bool(simplify), partition=bool(partition))
+    wall_time = time.perf_counter() - start
+    counters = profile.to_dict()['counters']
+    stats = {'paths': counters.get('paths_reported', 0),
+             'unsat': counters.get('paths_unsat', 0),
+             'solver_calls': counters.get('solver_calls', 0),
+             'inputs': counters.get('inputs_generated', 0),
+             'races': counters.get('portfolio_races', 0),
+             'solver_time': profile.to_dict()['timers'].get('solver', 0.0)}
+    stats['wall_time'] = wall_time
+    stats['paths_per_sec'] = stats['paths'] / wall_time if wall_time > 0 else 0.0
+    stats['peak_rss_kb'] = peak_rss()
+    return module.names[index], stats
+
+
+# the median of every timing over repeat runs; counts must not change between runs
+def combine(runs):
+    combined = dict(runs[0])
+    for key in ('wall_time', 'solver_time', 'paths_per_sec'):
+        combined[key] = statistics.median(run[key] for run in runs)
+    if combined['peak_rss_kb'] is not None:
+        combined['peak_rss_kb'] = max(run['peak_rss_kb'] for run in runs)
+    return combined
+
+
+def run_suite(suite, options, repeat, directory):
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for name, size in suite:
+        program = os.path.join(directory, '%s_%d.py' % (name, size))
+        with open(program, 'w') as f:
+            f.write(GENERATORS[name](size))
+        function_names = parse_program(program).names
+        tasks = [(program, i, options) for i in range(len(function_names)) for _ in range(repeat)]
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            measured = pool.map(measure_function, tasks, chunksize=1)
+        functions = {}
+        for i, fn_name in enumerate(function_names):
+            functions[fn_name] = combine([stats for _, stats in measured[i * repeat:(i + 1) * repeat]])
+        workload = {'workload': name, 'size': size, 'functions': functions}
+        results.append(workload)
+        print_workload(workload)
+    return results
+
+
+def print_workload(workload):
+    for fn_name, stats in workload['functions'].items():
+        print('%-14s %3d  %-14s paths=%-4d unsat=%-4d inputs=%-5d wall=%.3fs solver=%.3fs (%d calls) paths/s=%.1f rss=%skB' % (
+            workload['workload'], workload['size'], fn_name, stats['paths'], stats['unsat'], stats.get('inputs', 0), stats['wall_time'],
+            stats['solver_time'], stats['solver_calls'], stats['paths_per_sec'], stats['peak_rss_kb']))
+
+
+# ============================ Comparison ============================
+# functions whose wall time grew or whose throughput dropped by more than
+# threshold, and functions whose path counts changed
+def compare(baseline, current, threshold):
+    regressions = []
+    if baseline.get('version') != current['version']:
+        print('Warning: baseline is from benchmark version %s, not %s' % (baseline.get('version'), current['version']))
+    if baseline.get('options') != current['options']:
+        print('Warning: baseline was run with other options: %s' % baseline.get('options'))
+    old = {(w['workload'], w['size'], fn): stats for w in baseline.get('results', []) for fn, stats in w['functions'].items()}
+    for workload in current['results']:
+        for fn_name, stats in workload['functions'].items():
+            key = (workload['workload'], workload['size'], fn_name)
+            if key not in old:
+                continue
+            before = old[key]
+            label = '%s %d %s' % key
+            if before['wall_time'] > 0 and stats['wall_time'] > before['wall_time'] * (1 + threshold):
+                regressions.append('%s: wall time %.3fs -> %.3fs' % (label, before['wall_time'], stats['wall_time']))
+            if stats['paths_per_sec'] < before['paths_per_sec'] * (1 - threshold):
+                regressions.append('%s: paths/s %.1f -> %.1f' % (label, before['paths_per_sec'], stats['paths_per_sec']))
+            for count in ('paths', 'unsat'):
+                if stats[count] != before[count]:
+                    regressions.append('%s: %s %d -> %d' % (label, count, before[count], stats[count]))
+    return regressions
+
+
+def main(args):
+    suite = parse_suite(args.workload) if args.workload else DEFAULT_SUITE
+    options = (args.depth, args.tries, args.iter, args.constant, args.prune, args.workers, args.merge, args.search, args.portfolio, args.simplify, args.partition, args.inputs, args.unroll)
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_suite(suite, options, args.repeat, directory)
+    report = {
+        'version': BENCHMARK_VERSION,
+        'python': platform.python_version(),
+        'z3': z3.get_version_string(),
+        'platform': platform.platform(),
+        'options': dict(zip(('depth', 'tries', 'iter', 'constant', 'prune', 'workers', 'merge', 'search', 'portfolio', 'simplify', 'partition', 'inputs', 'unroll'), options), repeat=args.repeat),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Results written to ' + args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if not regressions:
+            print('No regressions against ' + args.compare)
+        return 1 if regressions else 0
+    return 0
+
+
+# main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the analysis on generated programs')
+    parser.add_argument("-o", "--output", help="output path of the JSON results", type=str, default="benchmark.json")
+    parser.add_argument("workload", help="workloads to run as NAME:SIZE (default: the whole suite); NAME is one of " + ', '.join(GENERATORS), nargs='*')
+    parser.add_argument("-n", "--repeat", help="runs of every function; timings are the median", type=int, default=3)
+    parser.add_argument("-d", "--depth", help="max depth", type=int, default=20)
+    parser.add_argument("-t", "--tries", help="max tries", type=int, default=10)
+    parser.add_argument("-r", "--iter", help="max iterations", type=int, default=20)
+    parser.add_argument("-c", "--constant", help="instantiate summaries of the called functions (0: False - 1: True (default))", type=int, default=1)
+    parser.add_argument("-p", "--prune", help="prune infeasible path prefixes while exploring (0: False (default) - 1: True)", type=int, default=0)
+    parser.add_argument("-w", "--workers", help="number of solver threads per function", type=int, default=1)
+    parser.add_argument("-s", "--search", help="search strategy", choices=list(SEARCH_STRATEGIES), default='bfs')
+    parser.add_argument("-m", "--merge", help="statements a merged conditional holds at most (0: no merging (default))", type=int, default=0)
+    parser.add_argument("--portfolio", help="milliseconds before a solver query is raced on every z3 configuration (disabled by default)", type=int, default=None)
+    parser.add_argument("--simplify", help="simplify paths before solving them (0: False - 1: True (default))", type=int, default=1)
+    parser.add_argument("--partition", help="solve independent clusters of a path separately (0: False - 1: True (default))", type=int, default=1)
+    parser.add_argument("-g", "--inputs", help="inputs generated per sat path (0: none (default))", type=int, default=0)
+    parser.add_argument("-k", "--unroll", help="iterations of a loop unrolled or gone around at most", type=int, default=UNROLL)
+    parser.add_argument("--compare", help="baseline JSON results to compare against; exits with 1 on regressions", type=str, default=None)
+    parser.add_argument("--threshold", help="relative slowdown reported as a regression", type=float, default=0.2)
+    args = parser.parse_args()
+    exit(main(args))
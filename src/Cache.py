@@ -0,0 +1,89 @@
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+# bump when the layout of the cached artifacts changes
+CACHE_VERSION = 2
+
+
+# content address of an artifact; parts must have a stable repr
+def content_key(*parts):
+    return hashlib.sha256(repr((CACHE_VERSION,) + parts).encode('utf-8')).hexdigest()
+
+
+# pickled artifacts stored under <directory>/<key[:2]>/<key>.pickle
+class ArtifactCache:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pickle')
+
+    def load(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def store(self, key, entry):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so a killed run never leaves half an entry
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+
+# bounded LRU of solver answers keyed by canonical query; entries evicted from
+# memory are spilled to an ArtifactCache when one is given. Shared by the solver
+# threads of a process, hence the lock
+class QueryCache:
+
+    def __init__(self, size, spill=None):
+        self.size = size
+        self.spill = spill
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query):
+        key = content_key(query)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            answer = self.spill.load(key) if self.spill is not None else None
+            if answer is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.insert(key, answer)
+            return answer
+
+    def put(self, query, answer):
+        with self.lock:
+            self.insert(content_key(query), answer)
+
+    def insert(self, key, answer):
+        self.entries[key] = answer
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            old_key, old_answer = self.entries.popitem(last=False)
+            if self.spill is not None:
+                self.spill.store(old_key, old_answer)
+
+    def stats(self):
+        return "%d hits, %d misses, %d entries" % (self.hits, self.misses, len(self.entries))
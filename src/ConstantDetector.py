@@ -1,4 +1,5 @@
-import re
+from Constraints import Var, Const, Call, BinOp, UnaryOp, Compare, BoolOp, Not, Ite, render, \
+    ASSIGN, CONSTANT
 
 
 # check string number
@@ -9,55 +10,66 @@ def is_number(s):
     except ValueError:
         return False
 
+# all calls made inside of a term
+def find_calls(term):
+    if isinstance(term, Call):
+        yield term
+        children = term.args
+    elif isinstance(term, BinOp):
+        children = [term.left, term.right]
+    elif isinstance(term, (UnaryOp, Not)):
+        children = [term.operand]
+    elif isinstance(term, Compare):
+        children = [term.left] + term.comparators
+    elif isinstance(term, BoolOp):
+        children = term.values
+    elif isinstance(term, Ite):
+        children = [term.test, term.body, term.orelse]
+    else:
+        children = []
+    for c in children:
+        yield from find_calls(c)
+
 # check if there is constant value assigned to such argument
 def check_constant(variable, constraints, location):
     constant = None
+    if isinstance(variable, Const):
+        return render(variable)
+    if not isinstance(variable, Var):
+        return None
     for index, ct in enumerate(constraints):
         if index > location:
             break
-        if variable in ct and ' == ' in ct and ',' not in ct:
-            value = ct.split(' == ')[-1].strip()
-            if is_number(value):
-                constant = value
-    print('#########################', constraints, constant)
+        if ct.kind in {ASSIGN, CONSTANT} and ct.target.ssa_name() == variable.ssa_name():
+            value = ct.term.comparators[0]
+            if isinstance(value, Const) and is_number(value.value):
+                constant = render(value)
     return constant
 
 
-# check if there is a function call; constraint is a list of z3 tokens
+# check if there is a function call; constraint is a list of Constraint
 def check_function_call(constraints, function_names):
     original_constraints = constraints
-    # original_node_list = node_list
-    # print(constraints)
-    removed_indexs = []
+    removed_indexs = set()
     function_with_args = {}
     function_with_constant = {}
     for i, ct in enumerate(constraints):
-        temp_list =  ct.split('(')
-        # print(temp_list)
-        for j, fc in enumerate(temp_list):
-            if fc in function_names:
-                arguments = temp_list[j+1]
-                arguments = arguments.replace(')', '').split(',')
-                fc_name_key = fc + '**' + str(i)
-                # print(fc, i)
-                function_with_args[fc_name_key] = arguments + [str(i)]
-                removed_indexs.append(i)
+        for fc in find_calls(ct.term):
+            if fc.func in function_names:
+                fc_name_key = fc.func + '**' + str(i)
+                function_with_args[fc_name_key] = (fc.args, i)
+                removed_indexs.add(i)
 
     for fc_name_key in function_with_args:
         function_with_constant[fc_name_key] = []
-        arguments = function_with_args[fc_name_key][:-1]
-        location = function_with_args[fc_name_key][-1]
+        arguments, location = function_with_args[fc_name_key]
         for variable in arguments:
-            variable = variable.strip()
             constant = None
-            constant = check_constant(variable, constraints, int(location))
-            # print(variable, constraints)
+            constant = check_constant(variable, constraints, location)
             if constant:
                 function_with_constant[fc_name_key].append(constant)
             else:
-                # print(constant)
                 function_with_constant[fc_name_key].append('unknown')
-            # print(constant)
 
     # delete if all args are unknown
     for fc_name_key in function_with_constant.copy():
@@ -66,7 +78,5 @@ def check_function_call(constraints, function_names):
 
     for i in reversed(sorted(removed_indexs)):
         original_constraints.pop(i)
-        # original_node_list.pop(i)
 
-    # print(function_with_constant)
     return original_constraints, function_with_constant
\ No newline at end of file
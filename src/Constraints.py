@@ -0,0 +1,591 @@
+import ast
+import astor
+import z3
+
+
+# ============================ Terms ============================
+# typed representation of the SSA predicates; terms are built once by the SSA
+# pass, translated to z3 by Z3Translator and rendered as source only for reports
+
+
+class Term:
+    pass
+
+
+class Var(Term):
+
+    def __init__(self, name, version=None):
+        # version is None for the function arguments bound at the entry node
+        self.name, self.version = name, version
+
+    def ssa_name(self):
+        if self.version is None:
+            return self.name
+        return '_%s_%d' % (self.name, self.version)
+
+
+class Const(Term):
+
+    def __init__(self, value):
+        self.value = value
+
+
+class BinOp(Term):
+
+    def __init__(self, op, left, right):
+        self.op, self.left, self.right = op, left, right
+
+
+class UnaryOp(Term):
+
+    def __init__(self, op, operand):
+        self.op, self.operand = op, operand
+
+
+class Compare(Term):
+
+    def __init__(self, left, ops, comparators):
+        self.left, self.ops, self.comparators = left, ops, comparators
+
+
+class BoolOp(Term):
+
+    def __init__(self, op, values):
+        # op is 'And' or 'Or'
+        self.op, self.values = op, values
+
+
+class Not(Term):
+
+    def __init__(self, operand):
+        self.operand = operand
+
+
+class Ite(Term):
+
+    def __init__(self, test, body, orelse):
+        # the value of a variable where the two sides of a conditional join
+        self.test, self.body, self.orelse = test, body, orelse
+
+
+class Call(Term):
+
+    def __init__(self, func, args):
+        # calls are never translated; they are either summarized or removed
+        self.func, self.args = func, args
+
+
+class Opaque(Term):
+
+    def __init__(self, src):
+        # anything outside of the supported dialect, kept for reporting only
+        self.src = src
+
+
+def eq(left, right):
+    return Compare(left, ['=='], [right])
+
+
+# ============================ Constraints ============================
+
+
+ENTER = 'enter'
+BRANCH = 'branch'
+ASSIGN = 'assign'
+LOOP = 'loop'
+CONSTANT = 'constant'
+# the returned value of a path, bound to __return__
+RETURN = 'return'
+# binding of the parameters of a callee to the arguments of a call site
+CALL = 'call'
+# the instantiated summary of a callee at a call site
+SUMMARY = 'summary'
+
+
+class Constraint:
+
+    def __init__(self, kind, term, target=None, line=0):
+        self.kind, self.term, self.target, self.line = kind, term, target, line
+        # depth of the path node whose branch decision produced this constraint
+        self.depth = None
+
+    def __str__(self):
+        return render(self.term, top=self.kind not in {ASSIGN, LOOP, CONSTANT, RETURN})
+
+    def __repr__(self):
+        return repr(str(self))
+
+
+def render_constraints(constraints):
+    return [str(c) for c in constraints]
+
+
+# ============================ Python AST -> Terms ============================
+
+
+BIN_OPS = {
+    ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.FloorDiv: '//',
+    ast.Mod: '%', ast.Pow: '**'}
+
+UNARY_OPS = {ast.USub: '-', ast.UAdd: '+'}
+
+CMP_OPS = {
+    ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>',
+    ast.GtE: '>=', ast.In: 'in', ast.NotIn: 'not in', ast.Is: 'is', ast.IsNot: 'is not'}
+
+
+def subscript_name(astnode):
+    # test[0] is tracked as the scalar variable test_0
+    index = astnode.slice
+    if isinstance(index, ast.Index):
+        index = index.value
+    if isinstance(astnode.value, ast.Name) and isinstance(index, ast.Constant) \
+            and isinstance(index.value, int):
+        return '%s_%d' % (astnode.value.id, index.value)
+    return None
+
+
+def call_name(astnode):
+    if isinstance(astnode.func, ast.Name):
+        return astnode.func.id
+    return None
+
+
+# convert a python expression into a term; rename(name) returns the Var to use
+def to_term(astnode, rename):
+    if isinstance(astnode, ast.BoolOp):
+        op = 'And' if isinstance(astnode.op, ast.And) else 'Or'
+        return BoolOp(op, [to_term(i, rename) for i in astnode.values])
+    elif isinstance(astnode, ast.BinOp) and type(astnode.op) in BIN_OPS:
+        return BinOp(BIN_OPS[type(astnode.op)],
+                     to_term(astnode.left, rename), to_term(astnode.right, rename))
+    elif isinstance(astnode, ast.UnaryOp):
+        if isinstance(astnode.op, ast.Not):
+            return Not(to_term(astnode.operand, rename))
+        elif type(astnode.op) in UNARY_OPS:
+            return UnaryOp(UNARY_OPS[type(astnode.op)], to_term(astnode.operand, rename))
+    elif isinstance(astnode, ast.Call) and call_name(astnode) and not astnode.keywords:
+        return Call(call_name(astnode), [to_term(i, rename) for i in astnode.args])
+    elif isinstance(astnode, ast.Compare) and all(type(o) in CMP_OPS for o in astnode.ops):
+        return Compare(to_term(astnode.left, rename),
+                       [CMP_OPS[type(o)] for o in astnode.ops],
+                       [to_term(i, rename) for i in astnode.comparators])
+    elif isinstance(astnode, ast.Name):
+        return rename(astnode.id)
+    elif isinstance(astnode, ast.Subscript) and subscript_name(astnode):
+        return rename(subscript_name(astnode))
+    elif isinstance(astnode, ast.Constant):
+        return Const(astnode.value)
+    return Opaque(astor.to_source(astnode).strip())
+
+
+# ============================ Term rewriting ============================
+
+
+# rebuild a term, replacing every Var by var(v) and every Call by call(c)
+def substitute(term, var=None, call=None):
+    def sub(t):
+        if isinstance(t, Var):
+            return var(t) if var else t
+        elif isinstance(t, Call):
+            args = [sub(a) for a in t.args]
+            return call(Call(t.func, args)) if call else Call(t.func, args)
+        elif isinstance(t, BinOp):
+            return BinOp(t.op, sub(t.left), sub(t.right))
+        elif isinstance(t, UnaryOp):
+            return UnaryOp(t.op, sub(t.operand))
+        elif isinstance(t, Compare):
+            return Compare(sub(t.left), t.ops, [sub(c) for c in t.comparators])
+        elif isinstance(t, BoolOp):
+            return BoolOp(t.op, [sub(v) for v in t.values])
+        elif isinstance(t, Not):
+            return Not(sub(t.operand))
+        elif isinstance(t, Ite):
+            return Ite(sub(t.test), sub(t.body), sub(t.orelse))
+        return t
+    return sub(term)
+
+
+def prefix_term(term, prefix):
+    return substitute(term, var=lambda v: Var(prefix + v.name, v.version))
+
+
+def variables(term):
+    found = []
+    substitute(term, var=lambda v: found.append(v) or v)
+    return found
+
+
+# the values of the literals of a term, in order; a negated number is a literal
+def constants(term):
+    if isinstance(term, Const):
+        return [term.value]
+    elif isinstance(term, UnaryOp) and term.op == '-' and isinstance(term.operand, Const) \
+            and type(term.operand.value) in {int, float}:
+        return [-term.operand.value]
+    elif isinstance(term, Call):
+        children = term.args
+    elif isinstance(term, BinOp):
+        children = [term.left, term.right]
+    elif isinstance(term, UnaryOp):
+        children = [term.operand]
+    elif isinstance(term, Compare):
+        children = [term.left] + term.comparators
+    elif isinstance(term, BoolOp):
+        children = term.values
+    elif isinstance(term, Not):
+        children = [term.operand]
+    elif isinstance(term, Ite):
+        children = [term.test, term.body, term.orelse]
+    else:
+        return []
+    return [value for child in children for value in constants(child)]
+
+
+# z3 sort name of the value of a term, None if it cannot be told
+def infer_sort(term, sorts):
+    if isinstance(term, Var):
+        return sorts.get(term.name)
+    elif isinstance(term, Const):
+        return CONST_SORTS.get(type(term.value))
+    elif isinstance(term, (Compare, BoolOp, Not)):
+        return 'z3.Bool'
+    elif isinstance(term, BinOp):
+        left, right = infer_sort(term.left, sorts), infer_sort(term.right, sorts)
+        return 'z3.Real' if 'z3.Real' in {left, right} or term.op == '/' else left or right
+    elif isinstance(term, UnaryOp):
+        return infer_sort(term.operand, sorts)
+    elif isinstance(term, Ite):
+        return infer_sort(term.body, sorts) or infer_sort(term.orelse, sorts)
+    return None
+
+
+# ============================ Terms -> source ============================
+
+
+# python operator precedence, used to decide where parentheses are needed
+PRECEDENCE = {
+    'cmp': 5, '+': 10, '-': 10, '*': 11, '/': 11, '//': 11, '%': 11,
+    'unary': 12, '**': 13}
+ATOM = 20
+
+
+def precedence(term):
+    if isinstance(term, Compare):
+        return PRECEDENCE['cmp']
+    elif isinstance(term, BinOp):
+        return PRECEDENCE[term.op]
+    elif isinstance(term, UnaryOp):
+        return PRECEDENCE['unary']
+    return ATOM
+
+
+def render(term, top=False):
+    def wrap(t, strict):
+        s = render(t)
+        p, q = precedence(t), precedence(term)
+        if p < q or (strict and p == q):
+            return '(%s)' % s
+        return s
+
+    if isinstance(term, Var):
+        s = term.ssa_name()
+    elif isinstance(term, Const):
+        s = repr(term.value)
+    elif isinstance(term, BinOp):
+        if term.op == '**':
+            s = '%s ** %s' % (wrap(term.left, True), wrap(term.right, False))
+        else:
+            s = '%s %s %s' % (wrap(term.left, False), term.op, wrap(term.right, True))
+    elif isinstance(term, UnaryOp):
+        s = '%s%s' % (term.op, wrap(term.operand, False))
+    elif isinstance(term, Compare):
+        parts = [wrap(term.left, True)]
+        for op, c in zip(term.ops, term.comparators):
+            parts += [op, wrap(c, True)]
+        s = ' '.join(parts)
+    elif isinstance(term, BoolOp):
+        s = 'z3.%s(%s)' % (term.op, ', '.join(render(v) for v in term.values))
+    elif isinstance(term, Not):
+        s = 'z3.Not(%s)' % render(term.operand)
+    elif isinstance(term, Ite):
+        s = 'z3.If(%s, %s, %s)' % (render(term.test), render(term.body), render(term.orelse))
+    elif isinstance(term, Call):
+        s = '%s(%s)' % (term.func, ', '.join(render(a) for a in term.args))
+    else:
+        s = term.src
+    if top and precedence(term) != ATOM:
+        s = '(%s)' % s
+    return s
+
+
+# ============================ Terms -> z3 ============================
+
+
+Z3_SORTS = {'z3.Int': z3.Int, 'z3.Real': z3.Real, 'z3.String': z3.String, 'z3.Bool': z3.Bool}
+
+CONST_SORTS = {bool: 'z3.Bool', int: 'z3.Int', float: 'z3.Real', str: 'z3.String'}
+
+
+class Untranslatable(Exception):
+    pass
+
+
+def is_integer(value):
+    return z3.is_int(value) if z3.is_expr(value) else type(value) is int
+
+
+def positive_literal(value):
+    return type(value) is int and value > 0
+
+
+# Python's / is true division, z3 / over ints is integer division; infer_sort
+# types a quotient as z3.Real
+def to_real(value):
+    return z3.ToReal(value) if z3.is_expr(value) and z3.is_int(value) else value
+
+
+# Python's a // b over z3 ints: z3 div and mod are euclidean, which only
+# rounds towards negative infinity for a positive divisor; for a negative
+# one it is the quotient of the negated operands
+def floor_div(a, b):
+    if positive_literal(b):
+        return a / b
+    if not z3.is_expr(b):
+        return (-a) / (-b)
+    return z3.If(b > 0, a / b, (-a) / (-b))
+
+
+# one translator per analyzed function; holds the symbol table of z3 constants
+# and memoizes the z3 expression of every constraint it translated. A constraint
+# outside of the dialect is tried again next time, the sort of a variable it
+# uses may be known by then
+class Z3Translator:
+
+    def __init__(self, sorts, ctx=None):
+        # sorts: variable name -> z3 sort name, ex. {'a': 'z3.Int'}
+        self.sorts = sorts
+        self.ctx = ctx
+        self.symbols = {}
+        self.exprs = {}
+
+    def symbol(self, var):
+        name = var.ssa_name()
+        if name not in self.symbols:
+            if self.sorts.get(var.name) not in Z3_SORTS:
+                raise Untranslatable(name)
+            self.symbols[name] = Z3_SORTS[self.sorts[var.name]](name, self.ctx)
+        return self.symbols[name]
+
+    # z3 expression of a constraint, or None if it is outside of the dialect
+    def translate(self, constraint):
+        if constraint not in self.exprs:
+            try:
+                expr = self.term(constraint.term)
+                if not z3.is_expr(expr):
+                    expr = z3.BoolVal(bool(expr), self.ctx)
+                if not z3.is_bool(expr):
+                    raise Untranslatable(str(constraint))
+            except (Untranslatable, z3.Z3Exception, TypeError, ZeroDivisionError):
+                return None
+            self.exprs[constraint] = expr
+        return self.exprs[constraint]
+
+    def term(self, t):
+        if isinstance(t, Var):
+            return self.symbol(t)
+        elif isinstance(t, Const):
+            if isinstance(t.value, (bool, int, float, str)):
+                return t.value
+        elif isinstance(t, BinOp):
+            left, right = self.term(t.left), self.term(t.right)
+            if t.op == '+':
+                return left + right
+            elif t.op == '-':
+                return left - right
+            elif t.op == '*':
+                return left * right
+            elif t.op in {'/', '//'}:
+                if not z3.is_expr(left) and not z3.is_expr(right):
+                    return left / right if t.op == '/' else left // right
+                if t.op == '/':
+                    return to_real(left) / to_real(right)
+                if is_integer(left) and is_integer(right):
+                    return floor_div(left, right)
+                return left / right
+            elif t.op == '%':
+                if is_integer(left) and is_integer(right) and not positive_literal(right):
+                    # Python's remainder has the sign of the divisor
+                    return left - right * floor_div(left, right)
+                return left % right
+            elif t.op == '**':
+                return left ** right
+        elif isinstance(t, UnaryOp):
+            operand = self.term(t.operand)
+            return -operand if t.op == '-' else operand
+        elif isinstance(t, Compare):
+            pairs = []
+            left = self.term(t.left)
+            for op, c in zip(t.ops, t.comparators):
+                right = self.term(c)
+                pairs.append(self.compare(op, left, right))
+                left = right
+            return pairs[0] if len(pairs) == 1 else z3.And(*[self.boolean(p) for p in pairs])
+        elif isinstance(t, BoolOp):
+            values = [self.boolean(self.term(v)) for v in t.values]
+            if not values:
+                return t.op == 'And'
+            return z3.And(*values) if t.op == 'And' else z3.Or(*values)
+        elif isinstance(t, Not):
+            return z3.Not(self.boolean(self.term(t.operand)))
+        elif isinstance(t, Ite):
+            return z3.If(self.boolean(self.term(t.test)), self.term(t.body), self.term(t.orelse))
+        raise Untranslatable(render(t))
+
+    def compare(self, op, left, right):
+        if op == '==':
+            return left == right
+        elif op == '!=':
+            return left != right
+        elif op == '<':
+            return left < right
+        elif op == '<=':
+            return left <= right
+        elif op == '>':
+            return left > right
+        elif op == '>=':
+            return left >= right
+        raise Untranslatable(op)
+
+    def boolean(self, v):
+        if z3.is_expr(v):
+            return v
+        return z3.BoolVal(bool(v), self.ctx)
+
+
+# ============================ Canonical queries ============================
+
+
+# structure of a term with every variable replaced by name(var)
+def shape(term, name):
+    if isinstance(term, Var):
+        return ('var', name(term))
+    elif isinstance(term, Const):
+        return ('const', type(term.value).__name__, repr(term.value))
+    elif isinstance(term, BinOp):
+        return ('bin', term.op, shape(term.left, name), shape(term.right, name))
+    elif isinstance(term, UnaryOp):
+        return ('unary', term.op, shape(term.operand, name))
+    elif isinstance(term, Compare):
+        return ('cmp', tuple(term.ops), shape(term.left, name),
+                tuple(shape(c, name) for c in term.comparators))
+    elif isinstance(term, BoolOp):
+        return (term.op, tuple(shape(v, name) for v in term.values))
+    elif isinstance(term, Not):
+        return ('not', shape(term.operand, name))
+    elif isinstance(term, Ite):
+        return ('ite', shape(term.test, name), shape(term.body, name), shape(term.orelse, name))
+    elif isinstance(term, Call):
+        return ('call', term.func, tuple(shape(a, name) for a in term.args))
+    return ('opaque', term.src)
+
+
+# a set of constraints up to the order of the constraints and the names of the
+# variables; alpha-equivalent sets share the same key, so their answers can be
+# reused. The answers are kept in terms of canonical positions and variables
+class CanonicalQuery:
+
+    def __init__(self, constraints, sorts):
+        # order by structure first, then number the variables by first use and
+        # order again with the numbered variables to break the remaining ties
+        anonymous = [repr(shape(c.term, lambda v: sorts.get(v.name))) for c in constraints]
+        order = sorted(range(len(constraints)), key=lambda i: anonymous[i])
+        self.names = {}
+        def number(v):
+            if v.ssa_name() not in self.names:
+                self.names[v.ssa_name()] = (len(self.names), sorts.get(v.name))
+            return self.names[v.ssa_name()]
+        shapes = [repr(shape(constraints[i].term, number)) for i in order]
+        positions = sorted(range(len(shapes)), key=lambda j: shapes[j])
+        # order[k] is the index in constraints of the k-th canonical constraint
+        self.order = [order[j] for j in positions]
+        self.key = '\n'.join(shapes[j] for j in positions)
+
+    # answer of a solved query; args maps z3 names to values, core lists indices
+    # into constraints. None if a value has no exact textual form
+    def encode(self, args, core):
+        if core is not None:
+            position = {i: k for k, i in enumerate(self.order)}
+            return 'unsat', sorted(position[i] for i in core)
+        values = {}
+        for name, value in args.items():
+            if name in self.names and value is not None:
+                data = value_to_data(value)
+                if data is None:
+                    return None
+                values[self.names[name][0]] = data
+        return 'sat', values
+
+    # inverse of encode for this query, values are created in ctx
+    def decode(self, answer, ctx=None):
+        status, data = answer
+        if status == 'unsat':
+            return None, sorted(self.order[k] for k in data)
+        args = {}
+        for name, (number, sort) in self.names.items():
+            if number in data:
+                args[name] = data_to_value(data[number], ctx)
+        return args, None
+
+
+# a z3 value, or a Python literal, as (sort, text); a bool is checked first,
+# since it is an int in Python. None if the value has no exact textual form
+def value_to_data(value):
+    if isinstance(value, bool):
+        return 'z3.Bool', str(value)
+    elif type(value) is int:
+        return 'z3.Int', str(value)
+    elif z3.is_true(value) or z3.is_false(value):
+        return 'z3.Bool', str(z3.is_true(value))
+    elif z3.is_int_value(value):
+        return 'z3.Int', str(value.as_long())
+    elif z3.is_rational_value(value):
+        return 'z3.Real', str(value.as_fraction())
+    elif z3.is_string_value(value):
+        return 'z3.String', value.as_string()
+    return None
+
+
+# a z3 value as the Python value a test would pass, ex. for a corpus of inputs
+def value_to_python(value):
+    if z3.is_int_value(value):
+        return value.as_long()
+    elif z3.is_rational_value(value):
+        return float(value.as_fraction())
+    elif z3.is_string_value(value):
+        return value.as_string()
+    elif z3.is_true(value) or z3.is_false(value):
+        return z3.is_true(value)
+    return str(value)
+
+
+# the value a model gives a variable of the sort it does not constrain
+def default_value(sort, ctx=None):
+    if sort == 'z3.Int':
+        return z3.IntVal(0, ctx)
+    elif sort == 'z3.Real':
+        return z3.RealVal(0, ctx)
+    elif sort == 'z3.String':
+        return z3.StringVal('', ctx)
+    return z3.BoolVal(False, ctx)
+
+
+def data_to_value(data, ctx=None):
+    sort, text = data
+    if sort == 'z3.Bool':
+        return z3.BoolVal(text == 'True', ctx)
+    elif sort == 'z3.Int':
+        return z3.IntVal(text, ctx)
+    elif sort == 'z3.Real':
+        return z3.RealVal(text, ctx)
+    return z3.StringVal(text, ctx)
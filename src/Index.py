@@ -0,0 +1,107 @@
+import ast
+from fuzzingbook import ControlFlow
+from fuzzingbook.ControlFlow import PyCFG
+from SymbolicFuzzer import declarations
+
+
+# the name PyCFG links a call by: the called name, or attribute for a method
+def callee_name(call):
+    func = call.func
+    while isinstance(func, ast.Call):
+        func = func.func
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute):
+        return func.attr
+    return None
+
+
+# PyCFG over the AST as it is, instead of a source round trip per function,
+# so the nodes keep the lines of the input file
+class ModuleCFG(PyCFG):
+
+    def parse(self, src):
+        return src
+
+
+# ============================ Module index ============================
+# the functions of a module, found in one pass over its AST: the definition of
+# every function, its call sites of functions of the module, and, on demand,
+# its typed symbol table and CFG. A CFG is only built for the functions being
+# analyzed and the functions they are linked with: the CFG links a call to the
+# entry of the callee and the exit of the callee back into every caller. Every
+# call graph component gets a CFG of its own, built by one gen_cfg over a module
+# of its functions, so every call is linked once: gen_cfg links the calls of all
+# the nodes registered so far each time it is called, and linking a call again
+# once the callee's entry is a child of the call links the callee's exit to its
+# entry. The links only set parents, the paths of a function end at its exit
+class ModuleIndex:
+
+    def __init__(self, function_nodes):
+        self.nodes = function_nodes
+        self.names = [node.name for node in function_nodes]
+        # the first definition of a name; the CFG links calls to the last one
+        self.functions = {}
+        for node in function_nodes:
+            self.functions.setdefault(node.name, node)
+        # {function: [(callee, line)]}, in the order of the source
+        self.calls = {name: [] for name in self.names}
+        for node in function_nodes:
+            for n in ast.walk(node):
+                if isinstance(n, ast.Call) and callee_name(n) in self.calls:
+                    self.calls[node.name].append((callee_name(n), n.lineno))
+        self.symbols = {}
+        self.components = {}
+        # summaries are computed on the CFG they belong to
+        self.summaries = {}
+        # {function: the CFG of its component}
+        self.cfgs = {}
+
+    # the typed symbol table of a function; ex. {'a': 'z3.Int', 'b': 'z3.Int'}
+    def symbol_table(self, name):
+        if name not in self.symbols:
+            self.symbols[name] = declarations(self.functions[name])
+        return self.symbols[name]
+
+    # the functions linked with name in the CFG, name included, in module order
+    def component(self, name):
+        if name not in self.components:
+            neighbours = {n: set() for n in self.names}
+            for caller, sites in self.calls.items():
+                for callee, _ in sites:
+                    neighbours[caller].add(callee)
+                    neighbours[callee].add(caller)
+            component = {name}
+            pending = [name]
+            while pending:
+                for n in neighbours[pending.pop()] - component:
+                    component.add(n)
+                    pending.append(n)
+            members = [n for n in dict.fromkeys(self.names) if n in component]
+            for n in members:
+                self.components[n] = members
+        return self.components[name]
+
+    # the variables a path of the function may use, over every function its
+    # paths run through; a fresh dict, the fuzzer adds the variables of summaries
+    def scope(self, name):
+        variables = {}
+        for n in self.component(name):
+            variables.update(self.symbol_table(n))
+        return variables
+
+    # the CFG of the component of name, built the first time it is asked for
+    def cfg(self, name):
+        if name not in self.cfgs:
+            component = self.component(name)
+            # the nodes of other CFGs must not be linked again
+            registry = ControlFlow.REGISTRY
+            ControlFlow.REGISTRY = {}
+            try:
+                py_cfg = ModuleCFG()
+                py_cfg.gen_cfg(ast.Module(body=[node for node in self.nodes if node.name in component], type_ignores=[]))
+            finally:
+                ControlFlow.REGISTRY = registry
+            for n in component:
+                self.cfgs[n] = py_cfg
+        return self.cfgs[name]
@@ -0,0 +1,174 @@
+import ast
+import copy
+
+# iterations of a `for` loop over a constant range that are unrolled, and
+# times a path goes around any other loop, at most
+UNROLL = 4
+
+ADDITIVE = {ast.Add, ast.Sub}
+
+# bits of the factor x *= c makes of a closed form at most, c ** iterations; a
+# longer loop is left to the path exploration
+MAX_FACTOR_BITS = 4096
+
+
+# the range of the loop variable of `for <name> in range(<int literals>)`, else None
+def range_values(node):
+    call = node.iter
+    if not isinstance(node.target, ast.Name) or not isinstance(call, ast.Call) \
+            or not isinstance(call.func, ast.Name) or call.func.id != 'range' \
+            or call.keywords or not 1 <= len(call.args) <= 3:
+        return None
+    bounds = []
+    for a in call.args:
+        if isinstance(a, ast.UnaryOp) and isinstance(a.op, ast.USub):
+            a, sign = a.operand, -1
+        else:
+            sign = 1
+        if not isinstance(a, ast.Constant) or type(a.value) is not int:
+            return None
+        bounds.append(sign * a.value)
+    if len(bounds) == 3 and bounds[2] == 0:
+        return None
+    return range(*bounds)
+
+
+def names(node):
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+
+
+# the statements of body leave the loop early
+def leaves_loop(body):
+    def walk(nodes):
+        for n in nodes:
+            if isinstance(n, (ast.Break, ast.Continue)):
+                return True
+            # a break of an inner loop ends the inner loop only
+            if isinstance(n, (ast.For, ast.While)):
+                if walk(n.orelse):
+                    return True
+                continue
+            if isinstance(n, ast.If) and (walk(n.body) or walk(n.orelse)):
+                return True
+        return False
+    return walk(body)
+
+
+# ============================ Induction variables ============================
+# a loop is an induction loop when every statement of its body updates its own
+# variable by a loop invariant step: x += e, x -= e, x = x + e, x = e + x,
+# x = x - e, or x *= c for an int literal c. A step may also be the loop
+# variable itself, which adds up to the sum of its values
+def induction_updates(node):
+    updates = []
+    for stmt in node.body:
+        if isinstance(stmt, ast.Pass):
+            continue
+        if isinstance(stmt, ast.AugAssign):
+            target, op, step = stmt.target, type(stmt.op), stmt.value
+        elif isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and isinstance(stmt.value, ast.BinOp):
+            target, op = stmt.targets[0], type(stmt.value.op)
+            left, right = stmt.value.left, stmt.value.right
+            if isinstance(target, ast.Name) and isinstance(left, ast.Name) and left.id == target.id:
+                step = right
+            elif op is ast.Add and isinstance(target, ast.Name) and isinstance(right, ast.Name) and right.id == target.id:
+                step = left
+            else:
+                return None
+        else:
+            return None
+        if not isinstance(target, ast.Name):
+            return None
+        updates.append((target.id, op, step))
+
+    assigned = {name for name, _, _ in updates}
+    if len(assigned) != len(updates) or node.target.id in assigned:
+        return None
+    for name, op, step in updates:
+        if any(isinstance(n, ast.Call) for n in ast.walk(step)):
+            return None
+        if op in ADDITIVE:
+            if isinstance(step, ast.Name) and step.id == node.target.id:
+                continue
+            if names(step) & (assigned | {node.target.id}):
+                return None
+        elif op is ast.Mult:
+            if not isinstance(step, ast.Constant) or type(step.value) is not int:
+                return None
+        else:
+            return None
+    return updates
+
+
+# the updates of an induction loop after all of its iterations over the
+# range values, over the values of the variables before the loop; None if a
+# factor would be too large a literal
+def closed_form(updates, loop_variable, values):
+    n = len(values)
+    statements = []
+    for name, op, step in updates:
+        if op is ast.Mult:
+            if abs(step.value) > 1 and n * abs(step.value).bit_length() > MAX_FACTOR_BITS:
+                return None
+            value = ast.BinOp(ast.Name(name, ast.Load()), ast.Mult(), ast.Constant(step.value ** n))
+        else:
+            if isinstance(step, ast.Name) and step.id == loop_variable:
+                # the sum of an arithmetic series
+                total = ast.Constant(n * (values[0] + values[-1]) // 2)
+            elif isinstance(step, ast.Constant) and type(step.value) in {int, float}:
+                total = ast.Constant(n * step.value)
+            else:
+                total = ast.BinOp(ast.Constant(n), ast.Mult(), copy.deepcopy(step))
+            value = ast.BinOp(ast.Name(name, ast.Load()), op(), total)
+        statements.append(ast.Assign([ast.Name(name, ast.Store())], value))
+    return statements
+
+
+# ============================ Lowering ============================
+# PyCFG gives a `for` loop one opaque iteration over an iterator the solver
+# cannot follow. Before the CFG is built, a loop over a constant range is
+# replaced by the closed form of its updates when it is an induction loop,
+# or else unrolled when it has at most `unroll` iterations and no break or
+# continue. Any other loop is left to the path exploration, which goes
+# around it at most `unroll` times
+class LoopLowering(ast.NodeTransformer):
+
+    def __init__(self, unroll):
+        self.unroll = unroll
+
+    def visit_For(self, node):
+        # inner loops first, so that an unrolled inner loop can make the outer
+        # one straight line code
+        self.generic_visit(node)
+        values = range_values(node)
+        if values is None or node.orelse:
+            return node
+        updates = induction_updates(node)
+        statements = []
+        if updates is not None:
+            if values:
+                lowered = closed_form(updates, node.target.id, values)
+                if lowered is None:
+                    return node
+                # the loop variable keeps its last value, as after the loop
+                statements = lowered + [self.bind(node.target.id, values[-1])]
+        elif len(values) <= self.unroll and not leaves_loop(node.body):
+            for value in values:
+                statements.append(self.bind(node.target.id, value))
+                statements += copy.deepcopy(node.body)
+        else:
+            return node
+        # the copies of the body keep their lines, the new statements get the line of the loop
+        for statement in statements:
+            for n in ast.walk(statement):
+                if not hasattr(n, 'lineno'):
+                    ast.copy_location(n, node)
+        return statements or [ast.copy_location(ast.Pass(), node)]
+
+    # an annotated assignment, so that the loop variable is declared as an int
+    def bind(self, name, value):
+        return ast.AnnAssign(ast.Name(name, ast.Store()), ast.Name('int', ast.Load()), ast.Constant(value), 1)
+
+
+def lower_loops(astree, unroll=UNROLL):
+    return LoopLowering(unroll).visit(astree)
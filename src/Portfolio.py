@@ -0,0 +1,141 @@
+import queue
+import threading
+import z3
+
+
+def tactic_solver(ctx):
+    return z3.Then('simplify', 'propagate-values', 'solve-eqs', 'qfnia', ctx=ctx).solver()
+
+
+def seeded_solver(seed, arith):
+    def make(ctx):
+        solver = z3.Solver(ctx=ctx)
+        solver.set('random_seed', seed)
+        solver.set('smt.arith.solver', arith)
+        return solver
+    return make
+
+
+# ============================ Configurations ============================
+# the z3 configurations a hard query is raced on: (name, solver factory over a
+# context, whether its unsat answers come with a core). A solver built from a
+# tactic answers unsat without a core; every tracked constraint stands in for it
+CONFIGURATIONS = [
+    ('default', lambda ctx: z3.Solver(ctx=ctx), True),
+    ('qf_nia', lambda ctx: z3.SolverFor('QF_NIA', ctx=ctx), True),
+    ('qf_lia', lambda ctx: z3.SolverFor('QF_LIA', ctx=ctx), True),
+    ('seed_1', seeded_solver(1, 2), True),
+    ('seed_2', seeded_solver(2, 6), True),
+    ('tactic_qfnia', tactic_solver, False),
+]
+
+
+# ============================ Portfolio ============================
+# a query goes to the configuration that won the most races so far, default
+# first on ties, for `threshold` milliseconds. A query it does not decide in
+# that time is hard: every configuration gets it at once, each in a z3 context
+# of its own, the first sat or unsat answer is taken and the other solvers are
+# interrupted. Shared by the fuzzers of a process, so the wins of one function
+# steer the queries of the next
+class Portfolio:
+
+    def __init__(self, threshold, configurations=CONFIGURATIONS):
+        self.threshold = threshold
+        self.configurations = configurations
+        self.wins = {name: 0 for name, _, _ in configurations}
+        self.lock = threading.Lock()
+
+    # the configurations by wins, in the order of the list on ties
+    def ranked(self):
+        with self.lock:
+            return sorted(self.configurations, key=lambda c: -self.wins[c[0]])
+
+    # a solver of the configuration over ctx holding the assertions, and the
+    # tracked expressions under the names p0, p1, ...
+    def solver(self, configuration, ctx, assertions, tracked):
+        solver = configuration[1](ctx)
+        for a in assertions:
+            solver.add(a)
+        for j, expr in enumerate(tracked):
+            solver.assert_and_track(expr, z3.Bool('p' + str(j), ctx))
+        return solver
+
+    # decide the assertions and tracked expressions, all over ctx; timeouts
+    # and counters are those of fuzzer. Returns (result, {name: value over ctx}
+    # when sat, indices of the unsat core in tracked when unsat)
+    def check(self, fuzzer, ctx, assertions, tracked):
+        configuration = self.ranked()[0]
+        solver = self.solver(configuration, ctx, assertions, tracked)
+        result = fuzzer.timed_check(solver, limit=self.threshold)
+        if result != z3.unknown:
+            return answer(configuration, solver, result, len(tracked), ctx)
+        timeout = fuzzer.query_timeout()
+        if timeout is not None:
+            # the first attempt counts against the solver timeout
+            timeout -= self.threshold
+            if timeout <= 0:
+                return z3.unknown, None, None
+        fuzzer.profile.count('portfolio_races')
+        with fuzzer.profile.timer('solver'):
+            outcome = self.race(ctx, assertions, tracked, timeout)
+        if outcome[0] is None:
+            return z3.unknown, None, None
+        configuration, solver, result = outcome
+        with self.lock:
+            self.wins[configuration[0]] += 1
+        fuzzer.profile.count('portfolio_wins_' + configuration[0])
+        fuzzer.profile.count('solver_' + str(result))
+        return answer(configuration, solver, result, len(tracked), ctx)
+
+    # (configuration, solver, result) of the first definitive answer, or
+    # (None, None, None) if every configuration gave up
+    def race(self, ctx, assertions, tracked, timeout):
+        entrants = []
+        for configuration in self.configurations:
+            context = z3.Context()
+            solver = self.solver(configuration, context, [a.translate(context) for a in assertions],
+                                 [expr.translate(context) for expr in tracked])
+            if timeout is not None:
+                solver.set('timeout', timeout)
+            entrants.append((configuration, solver, context))
+        answers = queue.Queue()
+        threads = []
+        for entrant in entrants:
+            thread = threading.Thread(target=run_entrant, args=(entrant, answers), daemon=True)
+            thread.start()
+            threads.append(thread)
+        outcome = (None, None, None)
+        for _ in entrants:
+            configuration, solver, result = answers.get()
+            if result != z3.unknown:
+                outcome = (configuration, solver, result)
+                break
+        # an interrupt that comes before the check starts is lost, so it is
+        # repeated until the solver returns
+        for (configuration, solver, context), thread in zip(entrants, threads):
+            while thread.is_alive():
+                context.interrupt()
+                thread.join(0.01)
+        return outcome
+
+
+def run_entrant(entrant, answers):
+    configuration, solver, _ = entrant
+    try:
+        result = solver.check()
+    except z3.Z3Exception:
+        result = z3.unknown
+    answers.put((configuration, solver, result))
+
+
+def answer(configuration, solver, result, tracked, ctx):
+    if result == z3.sat:
+        m = solver.model()
+        target = ctx or z3.main_ctx()
+        # the model of a race is over the context of the winner
+        if m.ctx != target:
+            m = m.translate(target)
+        return result, {d.name(): m[d] for d in m.decls()}, None
+    if not configuration[2]:
+        return result, None, list(range(tracked))
+    return result, None, sorted(int(str(c)[1:]) for c in solver.unsat_core())
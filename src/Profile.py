@@ -0,0 +1,68 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+# wall time of the phases of an analysis and counters of its events. A fuzzer
+# shares its profile with its solver threads and with the fuzzers computing
+# its summaries, hence the lock; timers of nested phases overlap
+class Profile:
+
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+        # str(value) -> number of occurrences, ex. the sizes of the unsat cores
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value):
+        with self.lock:
+            histogram = self.histograms.setdefault(name, {})
+            histogram[str(value)] = histogram.get(str(value), 0) + 1
+
+    # the items of iterable, the time spent producing them counted as name
+    def timed(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            with self.timer(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    # add the timers and counters of a profile given by to_dict
+    def merge(self, other):
+        for name, seconds in other['timers'].items():
+            self.add_time(name, seconds)
+        for name, n in other['counters'].items():
+            self.count(name, n)
+        for name, histogram in other['histograms'].items():
+            for value, n in histogram.items():
+                with self.lock:
+                    merged = self.histograms.setdefault(name, {})
+                    merged[value] = merged.get(value, 0) + n
+
+    # plain dicts, so that profiles can be pickled and dumped as JSON
+    def to_dict(self):
+        with self.lock:
+            return {'timers': dict(sorted(self.timers.items())),
+                    'counters': dict(sorted(self.counters.items())),
+                    'histograms': {name: dict(sorted(h.items(), key=lambda i: int(i[0])))
+                                   for name, h in sorted(self.histograms.items())}}
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import itertools
+import json
+
+# the JSON Lines stream is always written; the other formats are rendered from it
+REPORT_FORMATS = ['text', 'sarif', 'jsonl']
+
+SARIF_SCHEMA = 'https://json.schemastore.org/sarif-2.1.0.json'
+
+
+# ============================ Records ============================
+# a 'function' record opens the records of every analyzed function:
+#   {'type': 'function', 'function': name, 'line': line of its definition}
+# In a batch every record also has the 'file' of its function
+# followed by one 'path' record per solved path:
+#   {'type': 'path', 'function': name, 'path': number, 'status': 'sat' or 'unsat',
+#    'constraints': [...], 'arguments': {arg: value or None}}             when sat
+#    'core': [{'constraint': ..., 'line': ...}], 'shared_with': number or None,
+#    'statements': [{'line': ..., 'source': ...}]                        when unsat
+#    'reason': 'solver' or 'deadline'                                    when unknown
+# A path the solver gave up on is 'unknown'; an 'unexplored' path is a prefix
+# the analysis did not get to extend before a budget ran out.
+# The inputs generated for a sat path go to the corpus instead, one record each:
+#   {'type': 'input', 'function': name, 'path': number, 'inputs': {param: value}}
+def function_record(fn_name, line):
+    return {'type': 'function', 'function': fn_name, 'line': line}
+
+
+# pass the records of a run on: inputs to the corpus stream, the others to the report stream
+def record_writer(stream, corpus):
+    def write(record):
+        if record['type'] == 'input':
+            corpus.write(record)
+        else:
+            stream.write(record)
+    return write
+
+
+# one record per line, flushed as it is written, so a killed run keeps
+# every record written so far
+class ReportStream:
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w')
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_records(path):
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # the last line of a killed run may be cut short
+                return
+
+
+# the path records of every function, one function at a time, by function
+# name, qualified with the file in a batch
+def path_groups(path):
+    records = (r for r in read_records(path) if r['type'] == 'path')
+    return itertools.groupby(records, key=qualified_name)
+
+
+def qualified_name(record):
+    return record['file'] + ':' + record['function'] if 'file' in record else record['function']
+
+
+# report file next to the others: <output_path>/<program file name>_report.<extension>
+def report_file(output_path, input_program, extension, kind='report'):
+    filename = input_program.replace('\\', '/').split('/')[-1]
+    return output_path.rstrip('/\\') + '/' + filename + '_' + kind + '.' + extension
+
+
+# ============================ Text ============================
+# the text report reads the stream once for the unsat, the sat and the
+# undecided paths each
+def render_text(stream_path, text_path):
+    with open(text_path, 'w') as f:
+        f.write('===========================================================================\n')
+        f.write('===================== UNSAT PATH REPORT START =============================\n')
+        f.write('===========================================================================\n\n')
+        for fn_name, records in path_groups(stream_path):
+            f.write('\n################ FUNCTION NAME: ' + fn_name + ' ################\n')
+            for record in records:
+                if record['status'] == 'unsat':
+                    write_unsat_path(f, record)
+            f.write('\n' + '#' * (len(fn_name)+48) + '\n')
+
+        f.write('\n\n===========================================================================\n')
+        f.write('===================== OTHER SATISIED PATH CHECKED =========================\n')
+        f.write('===========================================================================\n\n')
+        for fn_name, records in path_groups(stream_path):
+            f.write('\n################ FUNCTION NAME: ' + fn_name + ' ################\n')
+            for record in records:
+                if record['status'] == 'sat':
+                    for arg, value in record['arguments'].items():
+                        f.write(str(arg) + ": " + str(value) + '\n')
+                    f.write('============ Contraint Path ============\n')
+                    for s in record['constraints']:
+                        f.write(s + '\n')
+                    f.write('========================================\n\n')
+            f.write('\n' + '#' * (len(fn_name)+48) + '\n')
+
+        # only runs cut short by a budget have this section
+        header = False
+        for fn_name, records in path_groups(stream_path):
+            records = [r for r in records if r['status'] not in {'sat', 'unsat'}]
+            if not records:
+                continue
+            if not header:
+                f.write('\n\n===========================================================================\n')
+                f.write('===================== PATHS LEFT UNDECIDED ================================\n')
+                f.write('===========================================================================\n\n')
+                header = True
+            f.write('\n################ FUNCTION NAME: ' + fn_name + ' ################\n')
+            for record in records:
+                status = record['status'] + (' (%s)' % record['reason'] if 'reason' in record else '')
+                f.write('------ path %d: %s\n' % (record['path'], status))
+                for s in record['constraints']:
+                    f.write('\t' + s + '\n')
+            f.write('\n' + '#' * (len(fn_name)+48) + '\n')
+
+
+def write_unsat_path(f, record):
+    f.write("\n================== ERROR: UNSAT PATH FOUND ===================\n")
+    f.write('------ constraint path: \n')
+    for s in record['constraints']:
+        f.write('\t' + s + '\n')
+    f.write('------ unsat core: \n')
+    f.write("Unsat core length:" + str(len(record['core'])) + '\n')
+    if record['shared_with'] is not None:
+        f.write("Unsat core (shared with path %s): " % record['shared_with'] + '\n')
+    else:
+        f.write("Unsat core: " + '\n')
+    for i, c in enumerate(record['core']):
+        f.write("\t" + str(i+1) + ":" + c['constraint'] + '\n')
+    # one statement per core constraint; the stream has the whole path
+    f.write('------ statement: \n')
+    f.write("Statements in Unsat Path: " + '\n')
+    for s in record['statements'][:len(record['core'])]:
+        f.write("\tLine" + str(s['line']) + ":" + s['source'] + '\n')
+    f.write('==============================================================\n\n')
+
+
+# ============================ SARIF ============================
+# one result per unsat path, in input_program, or in the file of the record in
+# a batch, located at the constraint of its unsat core that comes last on the
+# path, where the path becomes infeasible; at the definition of its function
+# if no constraint of the core has a line
+def render_sarif(stream_path, sarif_path, input_program):
+    uri = input_program.replace('\\', '/')
+    function_line = {}
+    with open(sarif_path, 'w') as f:
+        f.write('{"$schema": "%s", "version": "2.1.0", "runs": [{"tool": {"driver": ' % SARIF_SCHEMA)
+        f.write(json.dumps({'name': 'symbolic-fuzzer',
+                            'informationUri': 'https://github.com/allenmcasey/symbolic-fuzzer',
+                            'rules': [{'id': 'unsat-path',
+                                       'shortDescription': {'text': 'Unsatisfiable execution path'},
+                                       'fullDescription': {'text': 'The constraints of the path cannot hold together, so the statements on it are unreachable along this path.'}}]}))
+        f.write('}, "results": [')
+        first = True
+        for record in read_records(stream_path):
+            if record['type'] == 'function':
+                function_line[qualified_name(record)] = record['line']
+                continue
+            if record['status'] != 'unsat':
+                continue
+            f.write(('\n' if first else ',\n') + json.dumps(sarif_result(record, record.get('file', uri).replace('\\', '/'), function_line.get(qualified_name(record), 1))))
+            first = False
+        f.write('\n]}]}\n')
+
+
+def sarif_result(record, uri, function_line):
+    core = [c['constraint'] for c in record['core']]
+    lines = [c['line'] for c in record['core'] if c.get('line')]
+    line = lines[-1] if lines else function_line
+    message = 'Path %d of %s is unsatisfiable; unsat core: %s' % (record['path'], record['function'], ', '.join(core))
+    if record['shared_with'] is not None:
+        message += ' (shared with path %s)' % record['shared_with']
+    fingerprint = hashlib.sha256(repr((record['function'], core)).encode('utf-8')).hexdigest()
+    return {'ruleId': 'unsat-path',
+            'level': 'warning',
+            'message': {'text': message},
+            'locations': [{'physicalLocation': {'artifactLocation': {'uri': uri},
+                                                'region': {'startLine': line}},
+                           'logicalLocations': [{'name': record['function'], 'kind': 'function'}]}],
+            'partialFingerprints': {'unsatCore/v1': fingerprint}}
+
+
+def render(stream_path, report_format, output_path, input_program):
+    if report_format == 'text':
+        render_text(stream_path, report_file(output_path, input_program, 'txt'))
+    elif report_format == 'sarif':
+        render_sarif(stream_path, report_file(output_path, input_program, 'sarif'), input_program)
+
+
+# render the stream of a run, also of a killed one
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render a JSON Lines report')
+    parser.add_argument("stream", help="path of the <program>_report.jsonl stream", type=str)
+    parser.add_argument("-o", "--output", help="output path of the rendered report", type=str, required=True)
+    parser.add_argument("-f", "--format", help="report format", choices=['text', 'sarif'], default='text')
+    parser.add_argument("-i", "--input", help="input program path the SARIF results refer to", type=str, default='')
+    args = parser.parse_args()
+    if args.format == 'text':
+        render_text(args.stream, args.output)
+    else:
+        render_sarif(args.stream, args.output, args.input)
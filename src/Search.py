@@ -0,0 +1,166 @@
+import heapq
+import itertools
+import math
+import random
+from Constraints import variables, BRANCH
+
+
+# ============================ Frontier ============================
+# the path nodes not expanded yet, popped in the order of the priorities their
+# strategy gives them, the smallest first; nodes of equal priority are popped
+# in the order they were pushed
+class Frontier:
+
+    def __init__(self, strategy):
+        self.strategy = strategy
+        self.heap = []
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, node):
+        heapq.heappush(self.heap, (self.strategy.priority(node), next(self.counter), node))
+
+    def pop(self):
+        while True:
+            priority, count, node = heapq.heappop(self.heap)
+            # the priority of a node may have dropped since it was pushed; it
+            # goes back in its new place
+            if self.strategy.dynamic and self.heap:
+                current = self.strategy.priority(node)
+                if current > priority:
+                    heapq.heappush(self.heap, (current, count, node))
+                    continue
+            return node
+
+    # every node left, in the order they would have been popped
+    def drain(self):
+        nodes = [node for _, _, node in sorted(self.heap)]
+        self.heap = []
+        return nodes
+
+
+# ============================ Strategies ============================
+# a strategy orders the frontier; it is told about every path handed out, so
+# that it can steer the search away from what it has seen
+class Strategy:
+    # the priorities change as paths are handed out
+    dynamic = False
+
+    def priority(self, node):
+        raise NotImplementedError
+
+    def handed_out(self, node):
+        pass
+
+
+# level by level, the order of the original sweep
+class BreadthFirst(Strategy):
+
+    def priority(self, node):
+        return node.idx
+
+
+# the deepest node first; siblings in order, so complete paths come out early
+class DepthFirst(Strategy):
+
+    def priority(self, node):
+        return -node.idx
+
+
+def branch_decisions(node):
+    count = 0
+    n = node.parent
+    while n is not None:
+        if len(n.cfgnode.children) > 1:
+            count += 1
+        n = n.parent
+    return count
+
+
+# random path selection: a node is drawn with the probability of reaching it
+# by a random walk from the root, which halves at every branch, so paths with
+# few decisions are not starved by deep subtrees. Weighted sampling keys
+# -log(u) / weight; seeded, so runs are reproducible
+class RandomPath(Strategy):
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+
+    def priority(self, node):
+        return -math.log(1.0 - self.random.random()) * 2 ** branch_decisions(node)
+
+
+# shortest distance to an uncovered branch: the node from which the fewest CFG
+# edges lead to a branch some of whose sides no path handed out has taken;
+# deeper nodes first on ties
+class Coverage(Strategy):
+    dynamic = True
+
+    def __init__(self):
+        # (rid of a branching CFG node, index of the side taken)
+        self.covered = set()
+        self.distances = {}
+
+    def handed_out(self, node):
+        n = node
+        while n.parent is not None:
+            children = n.parent.cfgnode.children
+            if len(children) > 1:
+                # a merged conditional takes all of its sides
+                sides = [n.branch] if n.branch >= 0 else range(len(children))
+                for side in sides:
+                    if (n.parent.cfgnode.rid, side) not in self.covered:
+                        self.covered.add((n.parent.cfgnode.rid, side))
+                        self.distances = {}
+            n = n.parent
+
+    def distance(self, cfgnode):
+        if cfgnode.rid not in self.distances:
+            self.distances[cfgnode.rid] = math.inf
+            seen = {cfgnode.rid}
+            level = [cfgnode]
+            d = 0
+            while level and self.distances[cfgnode.rid] == math.inf:
+                following = []
+                for n in level:
+                    if len(n.children) > 1 and any((n.rid, i) not in self.covered for i in range(len(n.children))):
+                        self.distances[cfgnode.rid] = d
+                        break
+                    for c in n.children:
+                        if c.rid not in seen:
+                            seen.add(c.rid)
+                            following.append(c)
+                level = following
+                d += 1
+        return self.distances[cfgnode.rid]
+
+    def priority(self, node):
+        return self.distance(node.cfgnode), -node.idx
+
+
+# unsat first: the node whose path has the most branch decisions testing a
+# variable, at the same SSA version, that an earlier decision tested already;
+# such paths are the likeliest to contradict themselves. Deeper nodes first on ties
+class UnsatFirst(Strategy):
+
+    def priority(self, node):
+        tested = set()
+        related = 0
+        for p in node.edge_predicates() or []:
+            if p.kind == BRANCH:
+                names = {v.ssa_name() for v in variables(p.term)}
+                if names & tested:
+                    related += 1
+                tested |= names
+        return -related, -node.idx
+
+
+SEARCH_STRATEGIES = {
+    'bfs': BreadthFirst,
+    'dfs': DepthFirst,
+    'random': RandomPath,
+    'coverage': Coverage,
+    'unsat': UnsatFirst,
+}
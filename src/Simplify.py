@@ -0,0 +1,326 @@
+from Constraints import Var, Const, BinOp, UnaryOp, Compare, BoolOp, Not, Ite, Constraint, \
+    Z3_SORTS, CONST_SORTS, substitute, variables, infer_sort, ASSIGN, CONSTANT, ENTER, CALL
+
+
+# the result of folding a term would not be what z3 makes of the term it
+# comes from; the constraint is left as it is
+class Unsafe(Exception):
+    pass
+
+
+# ============================ Folding ============================
+# the value of the operators whose result is the same in Python and in the
+# translation to z3 on int literals: `//` and `%` are translated with Python's
+# rounding, but a zero divisor raises in Python, and z3 integer `/` is not Python's
+def fold_arith(op, a, b):
+    if op == '+':
+        return a + b
+    elif op == '-':
+        return a - b
+    elif op == '*':
+        return a * b
+    elif op == '//' and b != 0:
+        return a // b
+    elif op == '%' and b != 0:
+        return a % b
+    raise Unsafe(op)
+
+
+COMPARE = {'==': lambda a, b: a == b, '!=': lambda a, b: a != b, '<': lambda a, b: a < b,
+           '<=': lambda a, b: a <= b, '>': lambda a, b: a > b, '>=': lambda a, b: a >= b}
+
+
+def is_int(term):
+    return isinstance(term, Const) and type(term.value) is int
+
+
+def is_bool(term):
+    return isinstance(term, Const) and type(term.value) is bool
+
+
+# fold the literals of a term; an operator over literals only that cannot be
+# folded the way z3 would evaluate it raises Unsafe. A term with nothing to
+# fold is returned as it is
+def fold(term):
+    if isinstance(term, BinOp):
+        left, right = fold(term.left), fold(term.right)
+        if isinstance(left, Const) and isinstance(right, Const):
+            if is_int(left) and is_int(right):
+                return Const(fold_arith(term.op, left.value, right.value))
+            if term.op == '+' and type(left.value) is str and type(right.value) is str:
+                return Const(left.value + right.value)
+            raise Unsafe(term.op)
+        if left is term.left and right is term.right:
+            return term
+        return BinOp(term.op, left, right)
+    elif isinstance(term, UnaryOp):
+        operand = fold(term.operand)
+        if isinstance(operand, Const):
+            if not is_int(operand) or term.op not in {'-', '+'}:
+                raise Unsafe(term.op)
+            return Const(-operand.value if term.op == '-' else operand.value)
+        return term if operand is term.operand else UnaryOp(term.op, operand)
+    elif isinstance(term, Compare):
+        operands = [fold(term.left)] + [fold(c) for c in term.comparators]
+        if not all(isinstance(o, Const) for o in operands):
+            if all(o is p for o, p in zip(operands, [term.left] + term.comparators)):
+                return term
+            return Compare(operands[0], term.ops, operands[1:])
+        value = True
+        for op, a, b in zip(term.ops, operands, operands[1:]):
+            if op not in COMPARE or type(a.value) is not type(b.value) or type(a.value) not in {int, str, bool} \
+                    or (type(a.value) is bool and op not in {'==', '!='}):
+                raise Unsafe(op)
+            value = value and COMPARE[op](a.value, b.value)
+        return Const(value)
+    elif isinstance(term, BoolOp):
+        values = []
+        for v in term.values:
+            v = fold(v)
+            if isinstance(v, Const):
+                if not is_bool(v):
+                    raise Unsafe(term.op)
+                # And(.., False, ..) is False, Or(.., True, ..) is True
+                if v.value != (term.op == 'And'):
+                    return Const(v.value)
+                continue
+            values.append(v)
+        if not values:
+            return Const(term.op == 'And')
+        if len(values) == len(term.values) and all(v is w for v, w in zip(values, term.values)):
+            return term
+        return BoolOp(term.op, values)
+    elif isinstance(term, Not):
+        operand = fold(term.operand)
+        if isinstance(operand, Const):
+            if not is_bool(operand):
+                raise Unsafe('not')
+            return Const(not operand.value)
+        return term if operand is term.operand else Not(operand)
+    elif isinstance(term, Ite):
+        test = fold(term.test)
+        if isinstance(test, Const):
+            if not is_bool(test):
+                raise Unsafe('if')
+            return fold(term.body if test.value else term.orelse)
+        body, orelse = fold(term.body), fold(term.orelse)
+        if test is term.test and body is term.body and orelse is term.orelse:
+            return term
+        return Ite(test, body, orelse)
+    return term
+
+
+# ============================ Definitions ============================
+# the (target, value) pairs a constraint defines: an assignment defines its
+# SSA variable, the entry defines version 0 of every parameter as the
+# parameter and the binding of a call site defines the callee's parameters
+def definitions(constraint):
+    term = constraint.term
+    if constraint.kind in {ASSIGN, CONSTANT}:
+        return [(term.left, term.comparators[0])]
+    elif constraint.kind == ENTER:
+        return [(c.comparators[0], c.left) for c in term.values]
+    elif constraint.kind == CALL:
+        return [(c.left, c.comparators[0]) for c in term.values]
+    return []
+
+
+# ============================ Simplification ============================
+# a path of translatable constraints, simplified into an equisatisfiable query:
+# a variable defined once on the path as a literal or as a copy of another
+# variable of its sort is replaced by its value (constant and copy
+# propagation), the literals are folded, constraints folded to True are
+# dropped, and a definition no other constraint uses is dropped, since its
+# variable can always take its value. Propagation only shows in the query
+# where it folds a constraint or a definition down to a literal. Every constraint of the query comes
+# with the indices in constraints it follows from, so that an unsat core of
+# the query traces back to the path. Returns (query, origins).
+# memo keeps the rewritten constraints of a fuzzer across its paths, by
+# constraint and by the values substituted into it, so that paths sharing a
+# prefix share the constraint objects and their z3 translations; a constraint
+# that is not rewritten is the original object
+def simplify(constraints, sorts, memo=None):
+    memo = {} if memo is None else memo
+    # (constraint, conjunct, term, target, index) of every fact; a path that
+    # goes around a loop may define list elements more than once, those are left alone
+    defined = {}
+    facts = []
+    for i, c in enumerate(constraints):
+        pairs = definitions(c)
+        for target, value in pairs:
+            defined.setdefault(target.ssa_name(), []).append(i)
+        if c.kind in {ASSIGN, CONSTANT}:
+            facts.append((c, 0, c.term, c.target, i))
+        elif pairs:
+            facts += [(c, k, conjunct_term(c, k, target, value, memo), target, i)
+                      for k, (target, value) in enumerate(pairs)]
+        else:
+            facts.append((c, 0, c.term, None, i))
+
+    # the values known so far: ssa name -> (literal or variable, origins)
+    known = {}
+
+    def resolve(term, used):
+        def var(v):
+            return known[v.ssa_name()][0] if v.ssa_name() in known else v
+        term = fold(substitute(term, var=var) if used else term)
+        # a condition on a literal that is not a bool is left to the translator
+        if isinstance(term, Const) and not is_bool(term):
+            raise Unsafe(repr(term.value))
+        return term
+
+    query = []
+    for c, k, original, target, i in facts:
+        names = memoized(memo, ('vars', id(original)), original, lambda: ssa_names(original))
+        used = [n for n in names if n in known]
+        key = (id(c), k) + tuple((n, value_key(known[n][0])) for n in used)
+        # [constraint, rewritten term, its constraint object, rewritten at all]
+        entry = memo.get(key)
+        if entry is None:
+            try:
+                entry = memo[key] = [c, resolve(original, used), None, True]
+            except Unsafe:
+                entry = memo[key] = [c, original, None, False]
+        term = entry[1]
+        origins = {i}.union(*[known[n][1] for n in used]) if entry[3] else {i}
+        if isinstance(term, Const):
+            # facts folded to True hold, a fact folded to False is the whole query
+            if term.value:
+                continue
+            return [Constraint(c.kind, term, line=c.line)], [sorted(origins)]
+        defines = target is not None and is_definition(term, target)
+        if defines and len(defined[target.ssa_name()]) == 1:
+            value = term.comparators[0]
+            sort = sorts.get(target.name)
+            if sort in Z3_SORTS and (isinstance(value, Const) and CONST_SORTS.get(type(value.value)) == sort
+                                     and type(value.value) is not float
+                                     or isinstance(value, Var) and sorts.get(value.name) == sort
+                                     and value.ssa_name() != target.ssa_name()):
+                known[target.ssa_name()] = (value, origins)
+        # the query keeps a rewritten fact only if it is now a literal definition;
+        # any other rewrite costs a translation of its own and tells z3 nothing
+        # it does not find itself, so the fact goes to the query as it is
+        if entry[3] and not (defines and isinstance(term.comparators[0], Const)):
+            term, origins = original, {i}
+        query.append((term, target, origins, entry, original))
+
+    # drop the definitions no other constraint uses, until none is left to drop
+    while True:
+        uses = {}
+        for term, _, _, entry, original in query:
+            for n in memoized(memo, ('vars', id(term)), term, lambda: ssa_names(term)):
+                uses[n] = uses.get(n, 0) + 1
+        live = [fact for fact in query if not removable(fact[0], fact[1], uses, defined, sorts)]
+        if len(live) == len(query):
+            break
+        query = live
+
+    result, origins = [], []
+    for term, target, from_, entry, _ in query:
+        c = entry[0]
+        if term is c.term:
+            # nothing to fold, nothing to propagate
+            result.append(c)
+        else:
+            if entry[2] is None or entry[2].term is not term:
+                entry[2] = derived(c, term, target)
+            result.append(entry[2])
+        origins.append(sorted(from_))
+    return result, origins
+
+
+# ============================ Partitioning ============================
+# the constraints with the entry and every call binding split into one
+# constraint per parameter, which simplify does as well, so that parameters
+# bound together do not end up in one cluster; (constraints, origins) as
+# simplify returns them
+def conjuncts(constraints, memo=None):
+    memo = {} if memo is None else memo
+    result, origins = [], []
+    for i, c in enumerate(constraints):
+        pairs = definitions(c) if c.kind in {ENTER, CALL} else []
+        if len(pairs) < 2:
+            result.append(c)
+            origins.append([i])
+            continue
+        for k, (target, value) in enumerate(pairs):
+            result.append(memoized(memo, ('conjunct', id(c), k), c,
+                                   lambda: derived(c, conjunct_term(c, k, target, value, memo), target)))
+            origins.append([i])
+    return result, origins
+
+
+# the k-th binding of the entry or of a call site, target == value
+def conjunct_term(c, k, target, value, memo):
+    return memoized(memo, ('fact', id(c), k), c, lambda: Compare(target, ['=='], [value]))
+
+
+# a constraint over term standing for c, at its line and depth
+def derived(c, term, target):
+    constraint = Constraint(c.kind, term, target=target, line=c.line)
+    constraint.depth = c.depth
+    return constraint
+
+
+# the independent parts of a query: clusters of constraints that share no
+# variable, directly or through other constraints of the cluster, so that each
+# is satisfiable on its own exactly when the query is. Lists of indices in
+# constraints, in the order of their first constraint; memo is that of simplify
+def partition(constraints, memo=None):
+    memo = {} if memo is None else memo
+    parent = list(range(len(constraints)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # a constraint using the variable, by ssa name
+    owner = {}
+    for i, c in enumerate(constraints):
+        for n in memoized(memo, ('vars', id(c.term)), c.term, lambda: ssa_names(c.term)):
+            if n in owner:
+                parent[find(i)] = find(owner[n])
+            else:
+                owner[n] = i
+    clusters = {}
+    for i in range(len(constraints)):
+        clusters.setdefault(find(i), []).append(i)
+    return list(clusters.values())
+
+
+def ssa_names(term):
+    return [v.ssa_name() for v in variables(term)]
+
+
+# memo[key], computed by make the first time; owner is kept with the value so
+# that the object whose id is in the key is not collected and its id reused
+def memoized(memo, key, owner, make):
+    if key not in memo:
+        memo[key] = (owner, make())
+    return memo[key][1]
+
+
+def value_key(value):
+    if isinstance(value, Var):
+        return value.ssa_name()
+    return type(value.value).__name__, repr(value.value)
+
+
+# term still reads target == value
+def is_definition(term, target):
+    return isinstance(term, Compare) and term.ops == ['=='] and isinstance(term.left, Var) \
+        and term.left.ssa_name() == target.ssa_name()
+
+
+# a definition whose variable no other constraint uses, and that its variable
+# can always take: the value has the sort of the variable and does not use it
+def removable(term, target, uses, defined, sorts):
+    if target is None or len(defined[target.ssa_name()]) != 1 or not is_definition(term, target):
+        return False
+    value = term.comparators[0]
+    if uses.get(target.ssa_name(), 0) != 1 or target.ssa_name() in ssa_names(value):
+        return False
+    sort = sorts.get(target.name)
+    return sort in Z3_SORTS and infer_sort(value, sorts) == sort
@@ -27,15 +27,27 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import sys
+import copy
 import inspect
+import itertools
+import random
+import time
 import z3
 import ast
 import astor
-from fuzzingbook.ControlFlow import PyCFG, CFGNode, to_graph, gen_cfg
-from graphviz import Source, Graph
+from fuzzingbook.ControlFlow import to_graph, gen_cfg
+from graphviz import Source
 from fuzzingbook.Fuzzer import Fuzzer
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from Profile import Profile
+from Loops import UNROLL
+from Search import Frontier, SEARCH_STRATEGIES
+from Simplify import simplify, conjuncts, partition
+from Constraints import Constraint, Z3Translator, CanonicalQuery, Var, Const, BoolOp, Not, Ite, eq, to_term, \
+    call_name, subscript_name, substitute, prefix_term, variables, constants, infer_sort, render_constraints, \
+    value_to_python, default_value, Z3_SORTS, \
+    ENTER, BRANCH, ASSIGN, LOOP, RETURN, CALL, SUMMARY
 
 # ============================ Helper Functions ============================
 
@@ -63,107 +75,21 @@ def get_symbolicparams(fn):
             for name, typ in params], SYM_VARS[ret][0]('__return__')
 
 
-def prefix_vars(astnode, prefix):
-    if isinstance(astnode, ast.BoolOp):
-        return ast.BoolOp(astnode.op,
-                          [prefix_vars(i, prefix) for i in astnode.values], [])
-    elif isinstance(astnode, ast.BinOp):
-        return ast.BinOp(
-            prefix_vars(astnode.left, prefix), astnode.op,
-            prefix_vars(astnode.right, prefix))
-    elif isinstance(astnode, ast.UnaryOp):
-        return ast.UnaryOp(astnode.op, prefix_vars(astnode.operand, prefix))
-    elif isinstance(astnode, ast.Call):
-        return ast.Call(prefix_vars(astnode.func, prefix),
-                        [prefix_vars(i, prefix) for i in astnode.args],
-                        astnode.keywords)
-    elif isinstance(astnode, ast.Compare):
-        return ast.Compare(
-            prefix_vars(astnode.left, prefix), astnode.ops,
-            [prefix_vars(i, prefix) for i in astnode.comparators])
-    elif isinstance(astnode, ast.Name):
-        if astnode.id in {'And', 'Or', 'Not'}:
-            return ast.Name('z3.%s' % (astnode.id), astnode.ctx)
-        else:
-            return ast.Name('%s%s' % (prefix, astnode.id), astnode.ctx)
-    elif isinstance(astnode, ast.Return):
-        return ast.Return(prefix_vars(astnode.value, env))
-    else:
-        return astnode
-
-
-def get_expression(src):
-    return ast.parse(src).body[0].value
-
-
 def to_src(astnode):
     # print("to_src", astor.to_source(astnode))
     return astor.to_source(astnode).strip()
 
 
-def z3_names_and_types(z3_ast):
-    hm = {}
-    children = z3_ast.children()
-    if children:
-        for c in children:
-            hm.update(z3_names_and_types(c))
-    else:
-        # HACK.. How else to distinguish literals and vars?
-        if (str(z3_ast.decl()) != str(z3_ast.sort())):
-            hm["%s" % str(z3_ast.decl())] = 'z3.%s' % str(z3_ast.sort())
-        else:
-            pass
-
-
-def used_identifiers(src):
-    def names(astnode):
-        lst = []
-        if isinstance(astnode, ast.BoolOp):
-            for i in astnode.values:
-                lst.extend(names(i))
-        elif isinstance(astnode, ast.BinOp):
-            lst.extend(names(astnode.left))
-            lst.extend(names(astnode.right))
-        elif isinstance(astnode, ast.UnaryOp):
-            lst.extend(names(astnode.operand))
-        elif isinstance(astnode, ast.Call):
-            for i in astnode.args:
-                lst.extend(names(i))
-        elif isinstance(astnode, ast.Compare):
-            lst.extend(names(astnode.left))
-            for i in astnode.comparators:
-                lst.extend(names(i))
-        elif isinstance(astnode, ast.Subscript):
-            lst.append(to_src(astnode))
-        elif isinstance(astnode, ast.Name):
-            lst.append(astnode.id)
-        elif isinstance(astnode, ast.Expr):
-            lst.extend(names(astnode.value))
-        elif isinstance(astnode, (ast.Num, ast.Str, ast.Tuple, ast.NameConstant)):
-            pass
-        elif isinstance(astnode, ast.Assign):
-            for t in astnode.targets:
-                lst.extend(names(t))
-            lst.extend(names(astnode.value))
-        elif isinstance(astnode, ast.Module):
-            for b in astnode.body:
-                lst.extend(names(b))
-        else:
-            raise Exception(str(astnode))
-        return list(set(lst))
-    return names(ast.parse(src))
-
-
 SYM_VARS_STR = {
     k.__name__: ("z3.%s" % v1.__name__, "z3.%s" % v2.__name__)
     for k, (v1, v2) in SYM_VARS.items()
 }
 
 
+# summaries of the functions of the analyzed program, computed on demand by
+# function_summary; ex. {'func_c': {'predicate': z3.Or(...), 'vars': {'c': 'z3.Int', ...},
+# 'params': ['c']}}. None for functions without a usable summary
 Function_Summaries = {}
-Function_Summaries['func_name'] = {
-        'predicate': "",
-        'vars': {}}
 
 
 def translate_to_z3_name(v):
@@ -221,19 +147,22 @@ def declarations(astnode, hm=None):
     return hm
 
 
-def define_symbolic_vars(fn_vars, prefix):
-    sym_var_dec = ', '.join([prefix + n for n in fn_vars])
-    sym_var_def = ', '.join(["%s('%s%s')" % (t, prefix, n) for n, t in fn_vars.items()])
-    result = "%s = %s" % (sym_var_dec, sym_var_def)
-    return result
+# the summary predicate with every variable prefixed, and the sorts of the
+# prefixed variables
+def gen_fn_summary(prefix, summary):
+    decl = {prefix + n: t for n, t in summary['vars'].items()}
+    return decl, prefix_term(summary['predicate'], prefix)
 
 
-def gen_fn_summary(prefix, fn):
-    summary = Function_Summaries[fn.__name__]['predicate']
-    fn_vars = Function_Summaries[fn.__name__]['vars']
-    decl = define_symbolic_vars(fn_vars, prefix)
-    summary_ast = get_expression(summary)
-    return decl, to_src(prefix_vars(summary_ast, prefix))
+# summarize a function of the module index once; callees are summarized
+# first, on demand, and functions on a call cycle see None for the calls that
+# close the cycle
+def function_summary(name, module, **kwargs):
+    if name not in module.summaries:
+        module.summaries[name] = None
+        fuzzer = AdvancedSymbolicFuzzer(module, name, **kwargs)
+        module.summaries[name] = fuzzer.summarize()
+    return module.summaries[name]
 
 
 def used_vars(fn):
@@ -247,9 +176,53 @@ def checkpoint(z3solver):
     z3solver.pop()
 
 
+# a solver holding the edge predicates of one path prefix, one scope per node
+# of the prefix. Moving to another node pops the scopes of the nodes that are
+# not its ancestors and pushes those of its new ancestors, so a dfs or bfs
+# frontier only re-asserts a prefix when the search jumps to another subtree
+class PrefixSolver:
+
+    def __init__(self, translator):
+        self.solver = z3.Solver()
+        self.translator = translator
+        # the node at every depth of the asserted prefix
+        self.nodes = []
+
+    def move_to(self, node):
+        pending = []
+        n = node
+        while n is not None and not (n.idx < len(self.nodes) and self.nodes[n.idx] is n):
+            pending.append(n)
+            n = n.parent
+        keep = n.idx + 1 if n is not None else 0
+        if len(self.nodes) > keep:
+            self.solver.pop(len(self.nodes) - keep)
+            del self.nodes[keep:]
+        for n in reversed(pending):
+            self.solver.push()
+            self.add(n.predicates)
+            self.nodes.append(n)
+        return self.solver
+
+    def add(self, predicates):
+        for p in predicates:
+            expr = self.translator.translate(p)
+            if expr is not None:
+                self.solver.add(expr)
+
+
+# the indices in the path of an unsat core over the tracked constraints of a
+# query, and whether a constraint of the core stands for more than one of them
+def core_origins(core, tracked, origins):
+    return sorted({i for j in core for i in origins[tracked[j][0]]}), \
+        any(len(origins[tracked[j][0]]) > 1 for j in core)
+
+
 MAX_DEPTH = 100
 MAX_TRIES = 100
 MAX_ITER = 100
+PATH_BATCH = 16
+RETURN_VALUE = '__return__'
 
 
 # ============================ Simple Symbolic Fuzzer ============================
@@ -257,15 +230,18 @@ MAX_ITER = 100
 
 class SimpleSymbolicFuzzer(Fuzzer):
 
-    def __init__(self, arbitary_code, function_names, index, py_cfg, **kwargs):
+    # module: the ModuleIndex of the program, see Index.py
+    def __init__(self, module, fn_name, **kwargs):
 
-        self.fn_name = function_names[index]
-        self.function_names = function_names
-        self.py_cfg = py_cfg
+        self.module = module
+        self.fn_name = fn_name
+        self.function_names = module.names
+        self.py_cfg = module.cfg(fn_name)
         self.fnenter, self.fnexit = self.py_cfg.functions[self.fn_name]
 
-        # a dictionary of used variables; ex. {'a': 'z3.Int', 'b': 'z3.Int', 'c': 'z3.Int'}
-        self.used_variables = declarations(ast.parse(arbitary_code))
+        # a dictionary of used variables, of the functions the paths run
+        # through; ex. {'a': 'z3.Int', 'b': 'z3.Int', 'c': 'z3.Int'}
+        self.used_variables = module.scope(fn_name)
 
         # a list of arguments; ex. ['a', 'b', 'c']
         self.fn_args = list(self.used_variables.keys())
@@ -276,7 +252,6 @@ class SimpleSymbolicFuzzer(Fuzzer):
         self.last_path = None
 
         self.options(kwargs)
-        self.process()
 
     def options(self, kwargs):
         self.max_depth = kwargs.get('max_depth', MAX_DEPTH)
@@ -298,52 +273,14 @@ class SimpleSymbolicFuzzer(Fuzzer):
                 fnpaths.append([(idx, fenter)] + path)
         return fnpaths
 
+    # the paths are only materialized for fuzz(); the analysis streams them
     def process(self):
         self.paths = self.get_all_paths(self.fnenter)
         self.last_path = len(self.paths)
 
-    def extract_constraints(self, path):
-        predicates = []
-        for (idx, elt) in path:
-            if isinstance(elt.ast_node, ast.AnnAssign):
-                if elt.ast_node.target.id in {'_if', '_while'}:
-                    s = to_src(elt.ast_node.annotation)
-                    predicates.append(("%s" if idx == 0 else "z3.Not(%s)") % s)
-                elif isinstance(elt.ast_node.annotation, ast.Call):
-                    assert elt.ast_node.annotation.func.id == self.fn_name
-                else:
-                    node = elt.ast_node
-                    t = ast.Compare(node.target, [ast.Eq()], [node.value])
-                    predicates.append(to_src(t))
-            elif isinstance(elt.ast_node, ast.Assign):
-                node = elt.ast_node
-                t = ast.Compare(node.targets[0], [ast.Eq()], [node.value])
-                predicates.append(to_src(t))
-            else:
-                pass
-        return predicates
-
-    def solve_path_constraint(self, path):
-        # re-initializing does not seem problematic.
-        # a = z3.Int('a').get_id() remains the same.
-        constraints = self.extract_constraints(path)
-        decl = define_symbolic_vars(self.used_variables, '')
-        exec(decl)
-
-        solutions = {}
-        with checkpoint(self.z3):
-            st = 'self.z3.add(%s)' % ', '.join(constraints)
-            eval(st)
-            if self.z3.check() != z3.sat:
-                return {}
-            m = self.z3.model()
-            solutions = {d.name(): m[d] for d in m.decls()}
-            my_args = {k: solutions.get(k, None) for k in self.fn_args}
-        predicate = 'z3.And(%s)' % ','.join(["%s == %s" % (k, v) for k, v in my_args.items()])
-        eval('self.z3.add(z3.Not(%s))' % predicate)
-        return my_args
-
     def get_next_path(self):
+        if self.paths is None:
+            self.process()
         self.last_path -= 1
         if self.last_path == -1:
             self.last_path = len(self.paths) - 1
@@ -358,163 +295,350 @@ class SimpleSymbolicFuzzer(Fuzzer):
 
 
 def rename_variables(astnode, env):
-    if isinstance(astnode, ast.BoolOp):
-        fn = 'z3.And' if isinstance(astnode.op, ast.And) else 'z3.Or'
-        return ast.Call(
-            ast.Name(fn, None),
-            [rename_variables(i, env) for i in astnode.values], [])
-    elif isinstance(astnode, ast.BinOp):
-        return ast.BinOp(
-            rename_variables(astnode.left, env), astnode.op,
-            rename_variables(astnode.right, env))
-    elif isinstance(astnode, ast.UnaryOp):
-        if isinstance(astnode.op, ast.Not):
-            return ast.Call(
-                ast.Name('z3.Not', None),
-                [rename_variables(astnode.operand, env)], [])
+    def rename(name):
+        if name not in env:
+            env[name] = 0
+        return Var(name, env[name])
+    return to_term(astnode, rename)
+
+
+def is_exit_node(ast_node):
+    return isinstance(ast_node, ast.AnnAssign) and ast_node.target.id in {'exit'}
+
+
+def is_branch_node(ast_node):
+    return isinstance(ast_node, ast.AnnAssign) and ast_node.target.id in {'_if', '_while'}
+
+
+# the test a path goes through once per iteration of a loop, and once more to leave it
+def is_loop_head(ast_node):
+    return isinstance(ast_node, ast.AnnAssign) and ast_node.target.id in {'_while', '_for'}
+
+
+# PyCFG lowers `for` loops onto the synthetic iterator __iv and a `_for` test
+def is_loop_node(ast_node):
+    if isinstance(ast_node, ast.AnnAssign):
+        return ast_node.target.id == '_for'
+    if isinstance(ast_node, ast.Assign) and isinstance(ast_node.value, ast.Call):
+        return call_name(ast_node.value) in {'iter', 'next'} and '__iv' in to_src(ast_node)
+    return False
+
+
+def assign_predicate(assigned, value, env, kind, line):
+    env[assigned] = 0 if assigned not in env else env[assigned] + 1
+    target = Var(assigned, env[assigned])
+    return Constraint(kind, eq(target, value), target=target, line=line)
+
+
+# translate a CFG node, left through its child `order`, into its SSA predicates;
+# env is updated in place. Returns None when the branch cannot be expressed
+def single_assignment_predicates(cfgnode, order, env):
+    ast_node = cfgnode.ast_node
+    line = cfgnode.lineno()
+    new_path = []
+    if is_exit_node(ast_node):
+        pass
+    elif isinstance(ast_node, ast.AnnAssign) and ast_node.target.id in {'enter'}:
+        args = [eq(Var(a.id), Var(a.id, 0)) for a in ast_node.annotation.args]
+        # the arguments are version 0, the first assignment to one is version 1
+        for a in ast_node.annotation.args:
+            env[a.id] = 0
+        new_path.append(Constraint(ENTER, BoolOp('And', args), line=line))
+    elif is_branch_node(ast_node):
+        new_node = rename_variables(ast_node.annotation, env)
+        if order != 0:
+            # assert order == 1
+            if order != 1:
+                return None
+            new_node = Not(new_node)
+        new_path.append(Constraint(BRANCH, new_node, line=line))
+    elif is_loop_node(ast_node):
+        if isinstance(ast_node, ast.AnnAssign):
+            target, value = ast_node.target, ast_node.annotation
         else:
-            return ast.UnaryOp(astnode.op,
-                               rename_variables(astnode.operand, env))
-    elif isinstance(astnode, ast.Call):
-        return ast.Call(astnode.func,
-                        [rename_variables(i, env) for i in astnode.args],
-                        astnode.keywords)
-    elif isinstance(astnode, ast.Compare):
-        return ast.Compare(
-            rename_variables(astnode.left, env), astnode.ops,
-            [rename_variables(i, env) for i in astnode.comparators])
-    elif isinstance(astnode, ast.Name):
-        if astnode.id not in env:
-            env[astnode.id] = 0
-        num = env[astnode.id]
-        return ast.Name('_%s_%d' % (astnode.id, num), astnode.ctx)
+            target, value = ast_node.targets[0], ast_node.value
+        val = rename_variables(value, env)
+        new_path.append(assign_predicate(target.id, val, env, LOOP, line))
 
     # fixed
-    elif isinstance(astnode, ast.Subscript):
-        identifier = to_src(astnode)
-        name = identifier[:-3] + '_' + identifier[-2]
-        if name not in env:
-            env[name] = 0
-        num = env[name]
-        return ast.Name('_%s_%d' % (name, num), astnode.ctx)
-    elif isinstance(astnode, ast.Return):
-        return ast.Return(rename_variables(astnode.value, env))
+    elif isinstance(ast_node, ast.AnnAssign):
+        if isinstance(ast_node.value, ast.List):
+            for idx, element in enumerate(ast_node.value.elts):
+                assigned = ast_node.target.id + "_" + str(idx)
+                val = rename_variables(element, env)
+                # a list literal always starts a fresh set of elements
+                env.pop(assigned, None)
+                new_path.append(assign_predicate(assigned, val, env, ASSIGN, line))
+        else:
+            val = rename_variables(ast_node.value, env)
+            new_path.append(assign_predicate(ast_node.target.id, val, env, ASSIGN, line))
+
+    # fixed
+    elif isinstance(ast_node, ast.Assign):
+        if isinstance(ast_node.targets[0], ast.Subscript):
+            assigned = subscript_name(ast_node.targets[0]) or to_src(ast_node.targets[0])
+        else:
+            assigned = ast_node.targets[0].id
+        val = rename_variables(ast_node.value, env)
+        new_path.append(assign_predicate(assigned, val, env, ASSIGN, line))
+    elif isinstance(ast_node, ast.AugAssign):
+        if isinstance(ast_node.target, ast.Subscript):
+            assigned = subscript_name(ast_node.target) or to_src(ast_node.target)
+        else:
+            assigned = ast_node.target.id
+        # x op= e is x = x op e, over the version of x before the assignment
+        load = copy.deepcopy(ast_node.target)
+        load.ctx = ast.Load()
+        val = rename_variables(ast.BinOp(load, ast_node.op, ast_node.value), env)
+        new_path.append(assign_predicate(assigned, val, env, ASSIGN, line))
+    elif isinstance(ast_node, ast.Return) and ast_node.value is not None:
+        val = rename_variables(ast_node.value, env)
+        target = Var(RETURN_VALUE)
+        new_path.append(Constraint(RETURN, eq(target, val), target=target, line=line))
     else:
-        return astnode
+        # Pass and anything else do not add predicates
+        # s = "NI %s %s" % (type(ast_node), ast_node.target.id)
+        # raise Exception(s)
+        pass
+    return new_path
+
+
+# ============================ State merging ============================
+# the branch of a path node standing for both sides of a merged conditional
+MERGED = -1
+
+
+# statements both sides of a merged conditional may consist of; a call is
+# instantiated with the summary of its callee, which only holds on the side
+# that makes the call, so statements with calls are split on
+def is_merge_statement(ast_node):
+    if isinstance(ast_node, ast.Pass):
+        return True
+    if not isinstance(ast_node, (ast.Assign, ast.AnnAssign, ast.AugAssign)) \
+            or is_branch_node(ast_node) or is_loop_node(ast_node):
+        return False
+    return not any(isinstance(n, ast.Call) for n in ast.walk(ast_node))
+
+
+# the two sides of the conditional at cfgnode up to the node where they join:
+# (then side, else side, join node), when together they hold at most limit
+# statements that only assign values. A side lists its CFG nodes, and
+# (cfgnode, region) for a merged conditional nested in it. None when the paths
+# have to be split at cfgnode. regions memoizes the regions by CFG node
+def merge_region(cfgnode, limit, regions):
+    if cfgnode.rid not in regions:
+        regions[cfgnode.rid] = None
+        ast_node = cfgnode.ast_node
+        if isinstance(ast_node, ast.AnnAssign) and ast_node.target.id == '_if' and len(cfgnode.children) == 2 \
+                and not any(isinstance(n, ast.Call) for n in ast.walk(ast_node.annotation)):
+            sides = [merge_side(child, limit, regions) for child in cfgnode.children]
+            reached = [n.rid for n in sides[0][1]]
+            join = next((n for n in sides[1][1] if n.rid in reached), None)
+            if join is not None:
+                then, orelse = [items[:[n.rid for n in nodes].index(join.rid)] for items, nodes in sides]
+                if region_size(then) + region_size(orelse) <= limit:
+                    regions[cfgnode.rid] = then, orelse, join
+    return regions[cfgnode.rid]
+
+
+# the statements from node on, as long as they only assign values, and the
+# CFG nodes reached on the way; the walk goes past the join, to at most limit
+# statements
+def merge_side(node, limit, regions):
+    items, nodes = [], []
+    while region_size(items) <= limit:
+        nodes.append(node)
+        if is_merge_statement(node.ast_node) and len(node.children) == 1:
+            items.append(node)
+            node = node.children[0]
+            continue
+        region = merge_region(node, limit, regions)
+        if region is None:
+            break
+        items.append((node, region))
+        node = region[2]
+    return items, nodes
+
+
+def region_size(items):
+    return sum(1 if not isinstance(i, tuple) else region_size(i[1][0]) + region_size(i[1][1]) for i in items)
+
+
+# the predicates of a merged conditional: the assignments of both sides, on
+# versions of their own, then for every variable the sides leave at different
+# versions, a new version equal to z3.If(test, then version, else version).
+# The assignments hold on both sides since every version is assigned once;
+# env is updated in place
+def merge_predicates(cfgnode, region, env):
+    test = rename_variables(cfgnode.ast_node.annotation, env)
+    line = cfgnode.lineno()
+    new_path = []
+    envs = []
+    for side in region[:2]:
+        side_env = dict(env)
+        predicates = []
+        for item in side:
+            if isinstance(item, tuple):
+                predicates += merge_predicates(item[0], item[1], side_env)
+            else:
+                predicates += single_assignment_predicates(item, 0, side_env)
+        if envs:
+            shift_versions(predicates, side_env, env, envs[0])
+        envs.append(side_env)
+        new_path += predicates
+    then_env, else_env = envs
+    for name in sorted(set(then_env) | set(else_env)):
+        then_version, else_version = then_env.get(name), else_env.get(name)
+        if then_version is None or else_version is None or then_version == else_version:
+            env[name] = else_version if then_version is None else then_version
+            continue
+        env[name] = max(then_version, else_version) + 1
+        target = Var(name, env[name])
+        merged = Ite(test, Var(name, then_version), Var(name, else_version))
+        new_path.append(Constraint(ASSIGN, eq(target, merged), target=target, line=line))
+    return new_path
+
+
+# number the versions the else side assigns after those the then side assigned
+# (first_env) from env on
+def shift_versions(predicates, side_env, env, first_env):
+    shift = {name: version - env.get(name, -1) for name, version in first_env.items() if version != env.get(name)}
+
+    def var(v):
+        if v.name in shift and v.version is not None and v.version > env.get(v.name, -1):
+            return Var(v.name, v.version + shift[v.name])
+        return v
+    for c in predicates:
+        c.term = substitute(c.term, var=var)
+        if c.target is not None:
+            c.target = var(c.target)
+    for name, version in side_env.items():
+        side_env[name] = var(Var(name, version)).version
 
 
 def to_single_assignment_predicates(path):
     env = {}
     new_path = []
     completed_path = False
-    for i, node in enumerate(path):
-        ast_node = node.cfgnode.ast_node
-        new_node = None
-        if isinstance(ast_node, ast.AnnAssign) and ast_node.target.id in {
-                'exit'}:
+    for k, node in enumerate(path):
+        if is_exit_node(node.cfgnode.ast_node):
             completed_path = True
-            new_node = None
-        elif isinstance(ast_node, ast.AnnAssign) and ast_node.target.id in {'enter'}:
-            args = [
-                ast.parse(
-                    "%s == _%s_0" %
-                    (a.id, a.id)).body[0].value for a in ast_node.annotation.args]
-            new_node = ast.Call(ast.Name('z3.And', None), args, [])
-        elif isinstance(ast_node, ast.AnnAssign) and ast_node.target.id in {'_if', '_while'}:
-            new_node = rename_variables(ast_node.annotation, env)
-            if node.order != 0:
-                # assert node.order == 1
-                if node.order != 1:
-                    return [], False
-                new_node = ast.Call(ast.Name('z3.Not', None), [new_node], [])
-
-        # fixed
-        elif isinstance(ast_node, ast.AnnAssign):
-            if isinstance(ast_node.value, ast.List):
-                for idx, element in enumerate(ast_node.value.elts):
-                    assigned = ast_node.target.id + "_" + str(idx)
-                    val = [rename_variables(element, env)]
-                    env[assigned] = 0
-                    target = ast.Name('_%s_%d' % (assigned, env[assigned]), None)
-                    new_path.append(ast.Expr(ast.Compare(target, [ast.Eq()], val)))
-                pass
-            else:
-                assigned = ast_node.target.id
-                val = [rename_variables(ast_node.value, env)]
-                env[assigned] = 0 if assigned not in env else env[assigned] + 1
-                target = ast.Name('_%s_%d' % (assigned, env[assigned]), None)
-                new_node = ast.Expr(ast.Compare(target, [ast.Eq()], val))
-
-        # fixed
-        elif isinstance(ast_node, ast.Assign):
-            if isinstance(ast_node.targets[0], ast.Subscript):
-                identifier = to_src(ast_node.targets[0])
-                assigned = identifier[:-3] + '_' + identifier[-2]
-                val = [rename_variables(ast_node.value, env)]
-                env[assigned] = 0 if assigned not in env else env[assigned] + 1
-                target = ast.Name('_%s_%d' % (assigned, env[assigned]), None)
-            else:
-                assigned = ast_node.targets[0].id
-                val = [rename_variables(ast_node.value, env)]
-                env[assigned] = 0 if assigned not in env else env[assigned] + 1
-                target = ast.Name('_%s_%d' % (assigned, env[assigned]), None)
-            new_node = ast.Expr(ast.Compare(target, [ast.Eq()], val))
-        elif isinstance(ast_node, (ast.Return, ast.Pass)):
-            new_node = None
+        # the branch taken at a node is recorded on the next node of the path
+        order = path[k + 1].branch if k + 1 < len(path) else 0
+        predicates = single_assignment_predicates(node.cfgnode, order, env)
+        if predicates is None:
+            return [], False
+        new_path.extend(predicates)
+    return new_path, completed_path
+
+
+# ============================ Input generation ============================
+# the values tried first for a parameter: 0, 1 and -1, and the literals the
+# path tests, off by one either way, as single assumptions
+def boundary_assumptions(symbols, literals):
+    for p, s in symbols.items():
+        if z3.is_arith(s):
+            numbers = [v for v in literals if type(v) in {int, float}]
+            values = [0, 1, -1] + [v + d for v in numbers for d in (0, -1, 1)]
+            if z3.is_int(s):
+                values = [v for v in values if type(v) is int]
+        elif z3.is_string(s):
+            values = [''] + [v for v in literals if type(v) is str]
+        elif z3.is_bool(s):
+            values = [False, True]
         else:
             continue
-            # s = "NI %s %s" % (type(ast_node), ast_node.target.id)
-            # raise Exception(s)
-        new_path.append(new_node)
-    return new_path, completed_path
+        for v in dict.fromkeys(values):
+            yield (s == v,)
+
+
+# 2n draws of one half plane per numeric parameter, x >= r or x <= r, around
+# targets of random magnitude, so that the inputs spread out
+def random_assumptions(symbols, rng, n):
+    numeric = [s for s in symbols.values() if z3.is_arith(s)]
+    if not numeric:
+        return
+    for _ in range(2 * n):
+        assumptions = []
+        for s in numeric:
+            r = rng.randint(-2 ** rng.randint(1, 31), 2 ** rng.randint(1, 31))
+            assumptions.append(s >= r if rng.random() < 0.5 else s <= r)
+        yield tuple(assumptions)
 
 
-def identifiers_with_types(identifiers, defined):
-    with_types = dict(defined)
-    for i in identifiers:
-        if i[0] == '_':
-            if i.count('_') > 2:
-                last = i.rfind('_')
-                name = i[1:last]
-            else:
-                nxt = i[1:].find('_', 1)
-                name = i[1:nxt + 1]
-            assert name in defined
-            typ = defined[name]
-            with_types[i] = typ
-    return with_types
-  
-  
 # ============================ PNode ============================
 
 
 class PNode:
+    # a node of the path tree; branch is the index of this node among the
+    # children of its parent's CFG node, so the parent is shared by all of its
+    # children instead of being copied once per branch taken
+    __slots__ = ('idx', 'cfgnode', 'parent', 'branch', 'seen', 'env', 'predicates', 'exited', 'order', 'region')
 
-    def __init__(self, idx, cfgnode, parent=None, order=0, seen=None):
+    def __init__(self, idx, cfgnode, parent=None, branch=0, seen=None):
+        # visits per (CFG node, depth), shared by the whole tree
         self.seen = {} if seen is None else seen
-        self.max_iter = MAX_ITER
-        self.idx, self.cfgnode, self.parent, self.order = idx, cfgnode, parent, order
+        self.idx, self.cfgnode, self.parent, self.branch = idx, cfgnode, parent, branch
+        # SSA state on entry to this node, derived lazily from the parent:
+        # predicates are those of the parent for the branch taken to this node
+        self.env = None
+        self.predicates = None
+        self.exited = False
+        # the merge region skipped by the edge into this node, see MERGED
+        self.region = None
+        # branch taken at this node when a path ends here, see copy
+        self.order = 0
 
     def __repr__(self):
-        return "PNode:%d[%s order:%d]" % (self.idx, str(self.cfgnode), self.order)
+        return "PNode:%d[%s branch:%d]" % (self.idx, str(self.cfgnode), self.branch)
 
+    # a path that ends right after taking branch `order` of this node
     def copy(self, order):
-        p = PNode(self.idx, self.cfgnode, self.parent, order, self.seen)
-        assert p.order == order
+        p = PNode(self.idx, self.cfgnode, self.parent, self.branch, self.seen)
+        p.order = order
+        p.region = self.region
         return p
 
-    def explore(self):
+    # the children of this node; a path goes around a loop, back into its
+    # test, at most unroll times. A path that would go around once more ends here.
+    # region(cfgnode) gives the merge region of a conditional; a merged
+    # conditional has one child, the node where its sides join
+    def explore(self, unroll=None, region=None):
         ret = []
-        for (i, n) in enumerate(self.cfgnode.children):
-            key = "[%d]%s" % (self.idx + 1, n)
+        merged = region(self.cfgnode) if region is not None else None
+        children = [(MERGED, merged[2])] if merged is not None else enumerate(self.cfgnode.children)
+        for (i, n) in children:
+            key = n.rid << 32 | (self.idx + 1)
             ccount = self.seen.get(key, 0)
-            if ccount > self.max_iter:
+            if ccount > MAX_ITER:
                 continue  # drop this child
+            if unroll is not None and is_loop_head(n.ast_node) and self.visits(n) > unroll:
+                continue
             self.seen[key] = ccount + 1
-            pn = PNode(self.idx + 1, n, self.copy(i), seen=self.seen)
-            ret.append(pn)
+            child = PNode(self.idx + 1, n, self, i, self.seen)
+            child.region = merged
+            ret.append(child)
         return ret
 
+    # times the path to this node went through the CFG node cfgnode
+    def visits(self, cfgnode):
+        count = 0
+        n = self
+        while n is not None:
+            if n.cfgnode is cfgnode:
+                count += 1
+            n = n.parent
+        return count
+
+    # the (CFG node rid, branch taken) pairs from the root to this node
+    def signature(self):
+        pairs = []
+        n, order = self, self.order
+        while n is not None:
+            pairs.append((n.cfgnode.rid, order))
+            n, order = n.parent, n.branch
+        return tuple(reversed(pairs))
+
     def get_path_to_root(self):
         path = []
         n = self
@@ -524,155 +648,663 @@ class PNode:
         # print(list(reversed(path)))
         return list(reversed(path))
 
+    # translate the edges from the root to this node on top of the memoized
+    # state of the parent; only the ancestors that have not been translated
+    # yet are visited. Returns the predicates of the edge into this node
+    def single_assignment(self):
+        pending = []
+        n = self
+        while n is not None and n.env is None:
+            pending.append(n)
+            n = n.parent
+        for n in reversed(pending):
+            p = n.parent
+            if p is None:
+                n.env, n.predicates, n.exited = {}, [], False
+            elif p.predicates is None:
+                n.env, n.predicates, n.exited = p.env, None, p.exited
+            else:
+                n.env = dict(p.env)
+                n.exited = p.exited or is_exit_node(p.cfgnode.ast_node)
+                if n.region is not None:
+                    n.predicates = merge_predicates(p.cfgnode, n.region, n.env)
+                else:
+                    n.predicates = single_assignment_predicates(p.cfgnode, n.branch, n.env)
+                for c in n.predicates or []:
+                    c.depth = p.idx
+        return self.predicates
+
+    # the path ending at this node passed an exit
+    def is_completed(self):
+        self.single_assignment()
+        return self.exited or is_exit_node(self.cfgnode.ast_node)
+
+    # the predicates of the edges from the root to this node, None if a
+    # branch on the way cannot be expressed
+    def edge_predicates(self):
+        if self.single_assignment() is None:
+            return None
+        edges = []
+        n = self
+        while n is not None:
+            edges.append(n.predicates)
+            n = n.parent
+        return [p for edge in reversed(edges) for p in edge]
+
+    # same result as to_single_assignment_predicates(self.get_path_to_root())
+    def get_path_predicates(self):
+        predicates = self.edge_predicates()
+        if predicates is None:
+            return [], False
+        own = single_assignment_predicates(self.cfgnode, self.order, dict(self.env))
+        if own is None:
+            return [], False
+        for c in own:
+            c.depth = self.idx
+        predicates.extend(own)
+        return predicates, self.is_completed()
+
     def __str__(self):
-        path = self.get_path_to_root()
-        ssa_path = to_single_assignment_predicates(path)
-        return ', '.join([to_src(p) for p in ssa_path])
+        return ', '.join(str(p) for p in self.get_path_predicates()[0])
 
  
+# ============================ Unsat cores ============================
+
+
+# prefix trie of path signatures; a prefix is stored with the unsat core its
+# branch decisions produced. Paths sharing a prefix share its SSA predicates,
+# so every path below a stored prefix is unsat with the same core
+class CoreTrie:
+    CORE = None
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, prefix, core):
+        node = self.root
+        for pair in prefix:
+            node = node.setdefault(pair, {})
+        node[self.CORE] = core
+
+    # the core of the shortest stored prefix of signature, or None
+    def find(self, signature):
+        node = self.root
+        for pair in signature:
+            if self.CORE in node:
+                return node[self.CORE]
+            node = node.get(pair)
+            if node is None:
+                return None
+        return node.get(self.CORE)
+
+
 # ============================ Advanced Symbolic Fuzzer ============================
 
 
 class AdvancedSymbolicFuzzer(SimpleSymbolicFuzzer):
     def options(self, kwargs):
         super().options(kwargs)
+        self.prune = kwargs.get('prune', False)
+        # timers and counters, shared with the fuzzers computing the summaries
+        self.profile = kwargs.get('profile') or Profile()
+        kwargs['profile'] = self.profile
+        # no console output for every path
+        self.quiet = kwargs.get('quiet', False)
+        # budgets: time.time() by which the analysis stops, paths generated
+        # at most and milliseconds per solver query; None for unbounded
+        self.deadline = kwargs.get('deadline', None)
+        self.max_paths = kwargs.get('max_paths', None)
+        self.solver_timeout = kwargs.get('solver_timeout', None)
+        # times a path goes around a loop at most
+        self.unroll = kwargs.get('unroll', UNROLL)
+        # statements a merged conditional holds at most; 0 splits every path
+        self.merge = kwargs.get('merge', 0)
+        self.regions = {}
+        # name of the strategy ordering the exploration frontier, see Search.py
+        self.search = kwargs.get('search', 'bfs')
+        self.generated = 0
+        # path prefixes left unexplored when a budget ran out
+        self.unexplored = []
+        # unsat cores found so far, by the prefix of the paths they hold for
+        self.cores = CoreTrie()
+        # answers of alpha-equivalent queries, possibly shared with other fuzzers
+        self.query_cache = kwargs.get('query_cache', None)
+        # z3 configurations raced on hard queries, possibly shared with other
+        # fuzzers; None solves every query on a single solver, see Portfolio.py
+        self.portfolio = kwargs.get('portfolio', None)
+        # constant and copy propagation and folding before a path is solved,
+        # see Simplify.py
+        self.simplify = kwargs.get('simplify', True)
+        self.simplified = {}
+        # the clusters of a query that share no variable are solved one at a
+        # time; their answers are kept in the query cache, or here without one,
+        # so paths that only differ in one cluster reuse the answers of the others
+        self.partition = kwargs.get('partition', True)
+        self.cluster_answers = {}
+        # symbol table of z3 constants for this function
+        self.translator = Z3Translator(self.used_variables)
+        # the parameters, ex. ['a', 'b', 'c']
+        self.params = [a.id for a in self.fnenter.ast_node.annotation.args]
+        # inputs generated per sat path, on a z3 context of their own, so that
+        # the corpus does not depend on what the process solved before
+        self.inputs = kwargs.get('inputs', 0)
+        self.input_solver = None
 
     def extract_constraints(self, path):
-        result = []
-        generated_path, completed = to_single_assignment_predicates(path)
-        if not completed:
+        if not path:
+            return []
+        # the SSA predicates are memoized on the nodes, so paths sharing a
+        # prefix only translate the nodes that differ
+        result, completed = path[-1].get_path_predicates()
+        # in prune mode the only incomplete paths handed out are infeasible prefixes
+        if not completed and not self.prune:
             return []
-        for p in generated_path:
-            # if (isinstance(p, ast.AnnAssign) and p.target.id in {'exit', 'return'}):
-            if p:
-                result.append(to_src(p))
         return result
-        # return [to_src(p) for p in to_single_assignment_predicates(path) if p]
-
-    def solve_constraint(self, constraints, pNodeList):
-        # re-initializing does not seem problematic.
-        # a = z3.Int('a').get_id() remains the same.
-        identifiers = [c for i in constraints for c in used_identifiers(i)]  # <- changes
-        with_types = identifiers_with_types(identifiers, self.used_variables)  # <- changes
-        decl = define_symbolic_vars(with_types, '')
-        exec(decl)
-
-        solutions = {}
-        with checkpoint(self.z3):
-            unsat_info_dict = {}
-            unsat_info_dict['*core*'] = []
-            unsat_info_dict['*statement*'] = []
-            unsat_info_dict['*con*'] = []
-            print('origin constraints: ', constraints)
-            i = 0
-            unsa_path = {}
 
-            for con in constraints:
-                print("con: ", '\t' +  con)
-                unsat_info_dict['*con*'].append(str(con))
-                st2 = 'self.z3.assert_and_track(%s,"p%s")' % (con,str(i))
-                i=i+1
-                path_name = 'p'+ str(i)
-                unsa_path[z3.Bool(path_name)] = con
-                eval(st2)
-            if self.z3.check() != z3.sat:
+    def log(self, *args):
+        if not self.quiet:
+            print(*args)
+
+    # the merge region of the conditional at cfgnode, see merge_region
+    def region(self, cfgnode):
+        return merge_region(cfgnode, self.merge, self.regions)
+
+    def out_of_budget(self):
+        if self.deadline is not None and time.time() >= self.deadline:
+            return True
+        return self.max_paths is not None and self.generated >= self.max_paths
+
+    # milliseconds the next query may take, None for unbounded; 0 or less once
+    # the deadline has passed
+    def query_timeout(self):
+        timeout = self.solver_timeout
+        if self.deadline is not None:
+            remaining = int((self.deadline - time.time()) * 1000)
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    # solver.check(), timed and counted by result; a query never runs past the
+    # deadline, nor past limit milliseconds, and gives z3.unknown when it times out
+    def timed_check(self, solver, assumptions=(), limit=None):
+        timeout = self.query_timeout()
+        if self.deadline is not None and timeout <= 0:
+            self.profile.count('solver_skipped')
+            return z3.unknown
+        if limit is not None:
+            timeout = limit if timeout is None else min(timeout, limit)
+        if timeout is not None:
+            solver.set('timeout', timeout)
+        with self.profile.timer('solver'):
+            result = solver.check(*assumptions)
+        self.profile.count('solver_calls')
+        self.profile.count('solver_' + str(result))
+        return result
 
+    # solve one path on the given solver; returns (arguments, None) when sat,
+    # (None, indices of the unsat core in constraints) when unsat and
+    # (None, None) when the solver gave up
+    def check_path(self, solver, translator, constraints):
+        with self.profile.timer('translate'):
+            tracked = [(i, translator.translate(con)) for i, con in enumerate(constraints)]
+        tracked = [(i, expr) for i, expr in tracked if expr is not None]
+        # the constraints sent to the solver, each with the indices in
+        # constraints it follows from
+        reduced = [constraints[i] for i, _ in tracked]
+        origins = [[i] for i, _ in tracked]
+        if self.simplify:
+            with self.profile.timer('simplify'):
+                translatable = len(reduced)
+                reduced, from_ = simplify(reduced, self.used_variables, self.simplified)
+            # the constraints the simplified query no longer follows from
+            self.profile.count('constraints_dropped', translatable - len({k for f in from_ for k in f}))
+            origins = [[origins[k][0] for k in f] for f in from_]
+            with self.profile.timer('translate'):
+                tracked = [(j, translator.translate(c)) for j, c in enumerate(reduced)]
+            if reduced and isinstance(reduced[0].term, Const):
+                # a constraint folded to False
+                self.profile.count('paths_folded')
+                return None, origins[0]
+            if not reduced and not solver.assertions():
+                self.profile.count('paths_folded')
+                return self.arguments({}, translator), None
+        elif self.partition:
+            # parameters bound in one conjunction are not one cluster
+            reduced, from_ = conjuncts(reduced, self.simplified)
+            origins = [[origins[k][0] for k in f] for f in from_]
+            with self.profile.timer('translate'):
+                tracked = [(j, translator.translate(c)) for j, c in enumerate(reduced)]
+        else:
+            tracked = [(j, expr) for j, (_, expr) in enumerate(tracked)]
+        tracked = [(j, expr) for j, expr in tracked if expr is not None]
+        if self.partition:
+            clusters = partition([reduced[j] for j, _ in tracked], self.simplified)
+            self.profile.observe('query_clusters', len(clusters))
+        else:
+            clusters = [list(range(len(tracked)))]
+        # the first unsat cluster decides the path, a cluster the solver gives
+        # up on leaves it undecided
+        solutions, decided = {}, True
+        for cluster in clusters:
+            result, values, core = self.solve_query(solver, translator, [reduced[tracked[k][0]] for k in cluster],
+                                                    [tracked[k][1] for k in cluster])
+            if result == z3.unsat:
+                core = [cluster[k] for k in core]
+                return None, self.trace_core(translator, constraints, *core_origins(core, tracked, origins))
+            if result == z3.sat:
+                solutions.update(values)
+            else:
+                decided = False
+        if not decided:
+            return None, None
+        return self.arguments(solutions, translator), None
+
+    # decide the query of the constraints, whose z3 expressions are exprs,
+    # next to the assertions of solver. Returns (result, {name: value} when
+    # sat, indices of the unsat core in constraints when unsat)
+    def solve_query(self, solver, translator, constraints, exprs):
+        query = None
+        if self.query_cache is not None or self.partition:
+            query = CanonicalQuery(constraints, self.used_variables)
+            answer = self.cached_answer(query.key)
+            if answer is not None:
+                solutions, core = query.decode(answer, translator.ctx)
+                return (z3.sat if core is None else z3.unsat), solutions, core
+        # an unsat answer only holds for the query alone if nothing else is asserted
+        clean = not solver.assertions()
+        if self.portfolio is not None:
+            # the solver only lends its assertions, the blocking clauses
+            result, solutions, core = self.portfolio.check(self, translator.ctx, list(solver.assertions()), exprs)
+        else:
+            with checkpoint(solver):
+                for j, expr in enumerate(exprs):
+                    solver.assert_and_track(expr, z3.Bool('p' + str(j), translator.ctx))
+                result = self.timed_check(solver)
+                solutions, core = None, None
+                if result == z3.sat:
+                    m = solver.model()
+                    solutions = {d.name(): m[d] for d in m.decls()}
+                elif result == z3.unsat:
+                    core = sorted(int(str(c)[1:]) for c in solver.unsat_core())
+        if query is not None and (result == z3.sat or result == z3.unsat and clean):
+            answer = query.encode(solutions, core)
+            if answer is not None:
+                self.store_answer(query.key, answer)
+        return result, solutions, core
+
+    # the answer of a canonical query: from the query cache when there is one,
+    # else from the clusters this fuzzer solved
+    def cached_answer(self, key):
+        if self.query_cache is not None:
+            answer = self.query_cache.get(key)
+            self.profile.count('query_cache_misses' if answer is None else 'query_cache_hits')
+        else:
+            answer = self.cluster_answers.get(key)
+            self.profile.count('cluster_cache_misses' if answer is None else 'cluster_cache_hits')
+        return answer
 
-                # unsat_info_dict['*core*'].append("\n================== ERROR: UNSAT PATH FOUND ===================")
-                print("\n================== ERROR: UNSAT PATH FOUND ===================\n")
-                unsat_info_dict['*core*'].append("Unsat core length:" + str(len(self.z3.unsat_core())))
-                print("Unsat core length:", len(self.z3.unsat_core()))
-                unsa_core = self.z3.unsat_core()
-                unsat_info_dict['*core*'].append("Unsat core: ")
-                print("Unsat core: ")
-                for i in range(len(unsa_core)):
-                    if unsa_core[i] not in unsa_path:
-                        continue
-                    unsat_info_dict['*core*'].append("\t" + str(i+1) + ":" + str(unsa_path[unsa_core[i]]))
-                    print("\t",i+1,":", unsa_path[unsa_core[i]])
-                    # unsa_result.append(unsa_path[unsa_core[i]])
-
-                unsat_info_dict['*statement*'].append("Statements in Unsat Path: ")
-                print("Statements in Unsat Path: ")
-                for node in pNodeList:
-                    cfgnode_json = node.cfgnode.to_json()
-                    at = cfgnode_json['at']
-                    ast = cfgnode_json['ast']
-                    unsat_info_dict['*statement*'].append("\tLine" + str(at) + ":" + str(ast))
-                    print("\tLine", at, ":", ast)
-                # return unsa_result
-                return unsat_info_dict, True
-            m = self.z3.model()
-            solutions = {d.name(): m[d] for d in m.decls()}
-            my_args = {k: solutions.get(k, None) for k in self.fn_args}
-        predicate = 'z3.And(%s)' % ','.join(["%s == %s" % (k, v) for k, v in my_args.items() if v is not None])
-        eval('self.z3.add(z3.Not(%s))' % predicate)
-        return my_args, False
+    def store_answer(self, key, answer):
+        if self.query_cache is not None:
+            self.query_cache.put(key, answer)
+        else:
+            self.cluster_answers[key] = answer
+
+    # an unsat core of a simplified query holds the definitions propagated into
+    # its constraints, needed or not; the core of the path constraints it
+    # traces back to is whatever the solver finds unsat among them
+    def trace_core(self, translator, constraints, core, widened):
+        if not widened or len(core) < 2:
+            return core
+        solver = z3.Solver(ctx=translator.ctx)
+        for i in core:
+            solver.assert_and_track(translator.translate(constraints[i]), z3.Bool('p' + str(i), translator.ctx))
+        if self.timed_check(solver) != z3.unsat:
+            return core
+        return sorted(int(str(c)[1:]) for c in solver.unsat_core())
+
+    # the arguments of a sat path from the values of a solution; a parameter
+    # the simplified query does not constrain takes the default of its sort
+    def arguments(self, solutions, translator):
+        if self.simplify:
+            solutions = dict(solutions)
+            for p in self.params:
+                if p not in solutions and self.used_variables.get(p) in Z3_SORTS:
+                    translator.symbol(Var(p))
+                    solutions[p] = default_value(self.used_variables[p], translator.ctx)
+        return {k: solutions.get(k, None) for k in self.fn_args}
+
+    # the stored unsat core this path falls under: (core indices, number of
+    # the path it was found on), or None
+    def known_core(self, pNodeList):
+        return self.cores.find(pNodeList[-1].signature())
+
+    # store the core under the path prefix up to the deepest decision it
+    # depends on. A core found next to the blocking clauses of self.z3 is
+    # only stored if it is unsat on its own
+    def record_core(self, constraints, unsa_core, pNodeList, number, verify):
+        depths = [constraints[i].depth for i in unsa_core]
+        if not depths or None in depths:
+            return
+        if verify:
+            solver = z3.Solver()
+            for i in unsa_core:
+                solver.add(self.translator.translate(constraints[i]))
+            if self.timed_check(solver) != z3.unsat:
+                return
+        self.cores.insert(pNodeList[-1].signature()[:max(depths) + 1], (unsa_core, number))
+        self.profile.count('cores_recorded')
+
+    # outcome is the result of check_path when the path was already solved
+    # by solve_paths; otherwise it is solved here on self.z3, unless it falls
+    # under a known core. number identifies the path in the report. Returns
+    # the report entries of the path and 'sat', 'unsat' or 'unknown'
+    def solve_constraint(self, constraints, pNodeList, outcome=None, number=None):
+        self.log('origin constraints: ', constraints)
+        for con in constraints:
+            self.log("con: ", '\t' + str(con))
+
+        shared = self.known_core(pNodeList)
+        if shared is not None:
+            # the prefix, and so the positions of its constraints, are the same
+            outcome = (None, shared[0])
+            self.profile.count('cores_shared')
+        elif outcome is None:
+            outcome = self.check_path(self.z3, self.translator, constraints)
+            if outcome[0] is not None:
+                self.block_solution(outcome[0])
+            elif outcome[1] is not None:
+                self.record_core(constraints, outcome[1], pNodeList, number, bool(self.z3.assertions()))
+        elif outcome[1] is not None:
+            self.record_core(constraints, outcome[1], pNodeList, number, False)
+        my_args, unsa_core = outcome
+        if my_args is None and unsa_core is None:
+            self.profile.count('paths_unknown')
+            # the solver timed out or the deadline had passed already
+            reason = 'deadline' if self.deadline is not None and time.time() >= self.deadline else 'solver'
+            self.log("Solver gave up on the path (%s)" % reason)
+            return {'reason': reason}, 'unknown'
+        self.profile.count('paths_sat' if unsa_core is None else 'paths_unsat')
+        if unsa_core is not None:
+            self.profile.observe('core_size', len(unsa_core))
+            # the core and the statements of the path, for the report
+            unsat_info_dict = {'core': [], 'shared_with': None, 'statements': []}
+            self.log("\n================== ERROR: UNSAT PATH FOUND ===================\n")
+            self.log("Unsat core length:", len(unsa_core))
+            if shared is not None:
+                unsat_info_dict['shared_with'] = shared[1]
+                self.log("Unsat core (shared with path %s): " % shared[1])
+            else:
+                self.log("Unsat core: ")
+            for i, index in enumerate(unsa_core):
+                unsat_info_dict['core'].append({'constraint': str(constraints[index]), 'line': constraints[index].line})
+                self.log("\t",i+1,":", constraints[index])
+
+            self.log("Statements in Unsat Path: ")
+            for node in pNodeList:
+                cfgnode_json = node.cfgnode.to_json()
+                at = cfgnode_json['at']
+                ast = cfgnode_json['ast']
+                unsat_info_dict['statements'].append({'line': at, 'source': str(ast)})
+                self.log("\tLine", at, ":", ast)
+            return unsat_info_dict, 'unsat'
+        return my_args, 'sat'
+
+    # solve many paths at once on `workers` threads; every batch gets its own
+    # z3 context, so the solvers run outside of the GIL. The batches are fixed
+    # slices of constraint_lists, so the outcomes do not depend on the number
+    # of workers and are returned in path order
+    def solve_paths(self, constraint_lists, workers):
+        batches = [constraint_lists[i:i + PATH_BATCH]
+                   for i in range(0, len(constraint_lists), PATH_BATCH)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            solved = list(pool.map(self.solve_batch, batches))
+        return [outcome for batch in solved for outcome in batch]
+
+    def solve_batch(self, constraint_lists):
+        ctx = z3.Context()
+        translator = Z3Translator(self.used_variables, ctx)
+        solver = z3.Solver(ctx=ctx)
+        return [self.check_path(solver, translator, c) for c in constraint_lists]
 
     def solve_path_constraint(self, path):
-        # re-initializing does not seem problematic.
-        # a = z3.Int('a').get_id() remains the same.
         constraints = self.extract_constraints(path)
-        identifiers = [c for i in constraints for c in used_identifiers(i)]  # <- changes
-        with_types = identifiers_with_types(identifiers, self.used_variables)  # <- changes
-        decl = define_symbolic_vars(with_types, '')
-        exec(decl)
 
         solutions = {}
         with checkpoint(self.z3):
-            print('constraints: ', constraints)
-            st = 'self.z3.add(%s)' % ', '.join(constraints)
-            print('---------- st: ', st)
-            eval(st)
+            self.log('constraints: ', constraints)
+            for con in constraints:
+                expr = self.translator.translate(con)
+                if expr is not None:
+                    self.z3.add(expr)
             if self.z3.check() != z3.sat:
-                print("====== ERROR: UNSAT PATH ======\n\t", {k: solutions.get(k, None) for k in self.fn_args})
+                self.log("====== ERROR: UNSAT PATH ======\n\t", {k: solutions.get(k, None) for k in self.fn_args})
 
                 return {}
             m = self.z3.model()
             solutions = {d.name(): m[d] for d in m.decls()}
             my_args = {k: solutions.get(k, None) for k in self.fn_args}
-        predicate = 'z3.And(%s)' % ','.join(["%s == %s" % (k, v) for k, v in my_args.items() if v is not None])
-        eval('self.z3.add(z3.Not(%s))' % predicate)
+        self.block_solution(my_args)
         return my_args
 
+    # ask for different arguments next time
+    def block_solution(self, my_args):
+        predicate = [self.translator.symbols[k] == v for k, v in my_args.items() if v is not None]
+        if predicate:
+            self.z3.add(z3.Not(z3.And(predicate)))
+
+    # up to n distinct values of the parameters taking a sat path, from one
+    # incremental session: the path and its blocking clauses are asserted in a
+    # scope of the path, popped when it is done. The inputs on the boundaries
+    # of the path come first, then inputs steered to random half planes drawn
+    # from seed, then whatever the solver finds next. Blocking clauses slow
+    # every later query down, and assumptions rarely lead to an input found
+    # before, so an input is only blocked once it comes up again or when no
+    # assumption steers the solver away from it
+    def generate_inputs(self, constraints, n, seed=0):
+        params = [p for p in self.params if self.used_variables.get(p) in Z3_SORTS]
+        if n <= 0 or not params:
+            return []
+        if self.input_solver is None:
+            ctx = z3.Context()
+            self.input_translator = Z3Translator(self.used_variables, ctx)
+            self.input_solver = z3.Solver(ctx=ctx)
+        translator = self.input_translator
+        symbols = {p: translator.symbol(Var(p)) for p in params}
+        literals = [value for c in constraints for value in constants(c.term)]
+        rng = random.Random(seed)
+        inputs = []
+        seen = set()
+        solver = self.input_solver
+        solver.set('random_seed', seed)
+        with checkpoint(solver):
+            for con in constraints:
+                expr = translator.translate(con)
+                if expr is not None:
+                    solver.add(expr)
+            candidates = itertools.chain(boundary_assumptions(symbols, literals),
+                                         random_assumptions(symbols, rng, n),
+                                         itertools.repeat(()))
+            for assumptions in candidates:
+                if len(inputs) >= n or self.deadline is not None and time.time() >= self.deadline:
+                    break
+                result = self.timed_check(solver, assumptions)
+                if result == z3.sat:
+                    model = solver.model()
+                    values = {p: model.eval(s, model_completion=True) for p, s in symbols.items()}
+                    found = {p: value_to_python(v) for p, v in values.items()}
+                    key = tuple(found.values())
+                    if key in seen or not assumptions:
+                        solver.add(z3.Not(z3.And([symbols[p] == v for p, v in values.items()])))
+                    if key not in seen:
+                        seen.add(key)
+                        inputs.append(found)
+                elif not assumptions:
+                    # every input of the path is found, or the solver gave up
+                    break
+        self.profile.count('inputs_generated', len(inputs))
+        return inputs
+
     def get_all_paths(self, fenter):
-        path_lst = [PNode(0, fenter)]
-        completed = []
-        for i in range(self.max_iter):
-            new_paths = [PNode(0, fenter)]
-            for path in path_lst:
-                # explore each path once
-                if path.cfgnode.children:
-                    np = path.explore()
-                    for p in np:
-                        if path.idx > self.max_depth:
-                            break
-                        # if self.can_be_satisfied(p):
-                        #     new_paths.append(p)
-                        # else:
-                        #     break
-                        new_paths.append(p)
-                else:
-                    completed.append(path)
-            path_lst = new_paths
-        return completed + path_lst
+        return list(self.iter_paths(fenter))
+
+    # yield every path as soon as it ends; only the frontier is kept in memory.
+    # The paths still open after max_iter rounds are yielded last
+    def iter_paths(self, fenter):
+        # a path is identified by its branch decisions, so a duplicate is
+        # dropped before it is translated or solved
+        signatures = set()
+        for path in self.iter_search_paths(fenter):
+            self.profile.count('paths_explored')
+            signature = path.signature()
+            if signature not in signatures:
+                signatures.add(signature)
+                self.generated += 1
+                yield path
+            else:
+                self.profile.count('paths_deduplicated')
+
+    # pop the node the search strategy ranks first; a path is handed out
+    # where it ends, or where it reaches max_iter nodes, and the children of
+    # any other node go to the frontier, up to max_depth. When a budget runs
+    # out, the frontier is left in self.unexplored.
+    # In prune mode a child whose prefix is unsat is not pushed but handed out
+    # (once) so that it is reported as an unsat path, and only completed paths
+    # are handed out where the exploration stops
+    def iter_search_paths(self, fenter):
+        strategy = SEARCH_STRATEGIES[self.search]()
+        frontier = Frontier(strategy)
+        frontier.push(PNode(0, fenter))
+        solver = PrefixSolver(self.translator)
+        while frontier:
+            if self.out_of_budget():
+                self.unexplored += frontier.drain()
+                return
+            path = frontier.pop()
+            if path.idx >= self.max_iter or not path.cfgnode.children or (self.prune and path.idx > self.max_depth):
+                if not self.prune or path.is_completed():
+                    strategy.handed_out(path)
+                    yield path
+                continue
+            if path.idx > self.max_depth:
+                continue
+            for child in path.explore(self.unroll, self.region if self.merge else None):
+                if self.prune:
+                    if child.single_assignment() is None:
+                        continue
+                    if self.is_infeasible(solver, path, child):
+                        self.profile.count('paths_pruned')
+                        pruned = path.copy(child.branch)
+                        strategy.handed_out(pruned)
+                        yield pruned
+                        continue
+                frontier.push(child)
+
+    # the prefix up to child, through the branch at path, is unsat. Predicates
+    # outside of the dialect (calls, loop iterators) are left unconstrained, so
+    # a feasible path is never dropped; both sides of a merged conditional are taken.
+    # The prefix up to path stays asserted in the scopes of solver, a PrefixSolver
+    def is_infeasible(self, solver, path, child):
+        if not is_branch_node(path.cfgnode.ast_node) or child.region is not None:
+            return False
+        if all(self.translator.translate(p) is None for p in child.predicates):
+            return False
+        with checkpoint(solver.move_to(path)):
+            solver.add(child.predicates)
+            return self.timed_check(solver.solver) == z3.unsat
+
+    # replace every call of a summarized function by a fresh return variable,
+    # preceded by the binding of the callee's parameters to the arguments and
+    # the callee's summary, both over variables prefixed per call site
+    def instantiate_calls(self, constraints):
+        result = []
+        sites = 0
+        for c in constraints:
+            instantiated = []
+
+            def call(fc):
+                nonlocal sites
+                if fc.func not in self.function_names:
+                    return fc
+                with self.profile.timer('summaries'):
+                    summary = function_summary(fc.func, self.module, **self._options)
+                if summary is None or len(summary['params']) != len(fc.args):
+                    return fc
+                sites += 1
+                prefix = '%s_%d_' % (fc.func, sites)
+                decl, predicate = gen_fn_summary(prefix, summary)
+                self.used_variables.update(decl)
+                binding = [eq(Var(prefix + p), a) for p, a in zip(summary['params'], fc.args)]
+                instantiated.append(Constraint(CALL, BoolOp('And', binding), line=c.line))
+                instantiated.append(Constraint(SUMMARY, predicate, line=c.line))
+                return Var(prefix + RETURN_VALUE)
+
+            term = substitute(c.term, call=call)
+            if instantiated:
+                instantiated.append(Constraint(c.kind, term, target=c.target, line=c.line))
+                for i in instantiated:
+                    i.depth = c.depth
+                result += instantiated
+            else:
+                result.append(c)
+        return result
 
+    # disjunction of the feasible paths from the entry to the exit of this
+    # function, over its parameters and __return__. Paths are cut at the exit,
+    # since the CFG links it back into every caller. Loops go around at most
+    # unroll times and predicates outside of the dialect are left out, as for paths
+    def summarize(self):
+        seen = set()
+        paths = []
+        for path in self.iter_paths(self.fnenter):
+            exits = [n for n in path.get_path_to_root() if is_exit_node(n.cfgnode.ast_node)]
+            if not exits:
+                continue
+            constraints = [c for c in exits[0].get_path_predicates()[0] if c.kind != LOOP]
+            key = '__'.join(render_constraints(constraints))
+            if key in seen:
+                continue
+            seen.add(key)
+            paths.append(self.instantiate_calls(constraints))
+        # the summary of a function explored in part would rule out the
+        # behaviour of the rest
+        if self.unexplored:
+            return None
+
+        sort = None
+        fn = self.module.functions[self.fn_name]
+        if isinstance(fn.returns, ast.Name) and fn.returns.id in SYM_VARS_STR:
+            sort = translate_to_z3_name(fn.returns.id)
+        for c in [c for constraints in paths for c in constraints if c.kind == RETURN]:
+            sort = sort or infer_sort(c.term.comparators[0], self.used_variables)
+        if sort:
+            self.used_variables[RETURN_VALUE] = sort
+
+        # a translator of its own: the paths were explored, and in prune mode
+        # translated, before the return value had a sort
+        translator = Z3Translator(self.used_variables)
+        disjuncts = []
+        for constraints in paths:
+            constraints = [c for c in constraints if translator.translate(c) is not None]
+            # a path the solver gives up on is kept
+            if self.check_path(z3.Solver(), translator, constraints)[1] is None:
+                disjuncts.append(BoolOp('And', [c.term for c in constraints]))
+        if not disjuncts:
+            return None
+        predicate = BoolOp('Or', disjuncts)
+        return {'predicate': predicate,
+                'vars': {v.name: self.used_variables[v.name] for v in variables(predicate)},
+                'params': self.params}
 
     def can_be_satisfied(self, p):
-        s2 = self.extract_constraints(p.get_path_to_root())
-        # if any(fn_name in s2 for fn_name in self.function_names):
-        #     print("asdasdasdsadas")
-        # print(s2)
         s = z3.Solver()
-        identifiers = [c for i in s2 for c in used_identifiers(i)]
-        with_types = identifiers_with_types(identifiers, self.used_variables)
-        decl = define_symbolic_vars(with_types, '')
-        exec(decl)
-        exec("s.add(z3.And(%s))" % ','.join(s2), globals(), locals())
-        # sys.exit(0)
+        for c in self.extract_constraints(p.get_path_to_root()):
+            expr = self.translator.translate(c)
+            if expr is not None:
+                s.add(expr)
         return s.check() == z3.sat
 
     def get_next_path(self):
+        if self.paths is None:
+            self.process()
         self.last_path -= 1
         if self.last_path == -1:
             self.last_path = len(self.paths) - 1
@@ -1,179 +1,553 @@
 #!/usr/bin/env python3
 import argparse
+import collections
+import glob
+import itertools
 import os
-import tempfile
 import ast
 import astor
 import sys
-import inspect
+import io
+import json
+import time
+import contextlib
+import multiprocessing
 import ConstantDetector
-from fuzzingbook.ControlFlow import gen_cfg, PyCFG
-from SymbolicFuzzer import AdvancedSymbolicFuzzer,SimpleSymbolicFuzzer
-import platform
+from SymbolicFuzzer import AdvancedSymbolicFuzzer, PATH_BATCH, SYM_VARS_STR
+from Index import ModuleIndex
+from Cache import ArtifactCache, QueryCache, content_key
+from Profile import Profile
+from Portfolio import Portfolio
+from Loops import UNROLL, lower_loops
+from Search import SEARCH_STRATEGIES
+from Report import ReportStream, REPORT_FORMATS, function_record, record_writer, report_file, render
+from Constraints import render_constraints, LOOP, RETURN
+
+# the options every function of a run is analyzed with, by name; they are
+# part of the cache key of a function and go to the worker processes
+AnalysisOptions = collections.namedtuple('AnalysisOptions', [
+    'max_depth', 'max_tries', 'max_iter', 'summaries', 'prune', 'workers', 'quiet', 'solver_timeout', 'portfolio',
+    'simplify', 'partition', 'function_timeout', 'max_paths', 'merge', 'search', 'inputs', 'unroll'])
+
 
 def main(args):
     # ============================ read input program as code_string ============================
-    input_program = args.input
     output_path = args.output
     selected_function_name = args.func
-    check_constant = args.constant
+    summaries = args.constant
     max_depth = args.depth
     max_iter = args.iter
     max_tries = args.tries
+    prune = args.prune
+    jobs = args.jobs
+    workers = args.workers
+    # several files, directories or globs are analyzed in one batch
+    batch = len(args.input) > 1 or not os.path.isfile(args.input[0])
+    # nobody reads the console output of every path of a batch
+    quiet = args.quiet or batch
+    cache = ArtifactCache(args.cache) if args.cache else None
+    query_options = (args.query_cache, args.query_spill)
+    # the deadline of the whole run is a point in time, shared by the worker processes
+    deadline = time.time() + args.deadline if args.deadline is not None else None
     if not os.path.exists(output_path):
         os.makedirs(output_path)
+    options = AnalysisOptions(max_depth=max_depth, max_tries=max_tries, max_iter=max_iter, summaries=summaries, prune=prune,
+                              workers=workers, quiet=quiet, solver_timeout=args.solver_timeout, portfolio=args.portfolio,
+                              simplify=bool(args.simplify), partition=bool(args.partition),
+                              function_timeout=args.function_timeout, max_paths=args.max_paths, merge=args.merge,
+                              search=args.search, inputs=args.inputs, unroll=args.unroll)
+
+    if batch:
+        analyze_batch(args.input, output_path, selected_function_name, options, jobs, cache, query_options, args.format, args.profile, deadline)
+        return
+    input_program = args.input[0]
 
     # ============================ Initialization ============================
-    function_names = []
-    function_CFGs = {}
-    py_cfg = PyCFG()
-    # create AST from source file; get string
-    astree = astor.parse_file(input_program)
-    code_string = astor.to_source(astree)
-    results = []
-
-    # ============================ CFG generation ============================
-    # get CFG of each defined fn
-    index = 0
-    for node in ast.walk(astree):
-        if isinstance(node, ast.FunctionDef):
-            function_names.append(node.name)
-            if selected_function_name == node.name:
-                selected_index = index
-            function_CFGs[node.name] = py_cfg.gen_cfg(astor.to_source(node))
-            index += 1
+    start = time.perf_counter()
+    profile = Profile()
+    with profile.timer('parse'):
+        module = parse_program(input_program, args.unroll)
+    function_names = module.names
+    profiles = {}
+
     # ============================ Analysis ============================
     # only check selected function
     if selected_function_name:
-        print_func(selected_function_name)
-        results += analyze_program(code_string, function_names, selected_index, py_cfg, max_depth, max_tries, max_iter, check_constant)
+        indices = [function_names.index(selected_function_name)]
     # analyze all functions from input program
     else:
-        for i in range(len(function_names)):
-            print_func(function_names[i])
-            results += analyze_program(code_string, function_names, i, py_cfg, max_depth, max_tries, max_iter, check_constant)
+        indices = list(range(len(function_names)))
+    query_cache = make_query_cache(query_options)
+    # every path is written to the stream as soon as it is solved, and its
+    # inputs to the corpus
+    stream_path = report_file(output_path, input_program, 'jsonl')
+    stream = ReportStream(stream_path)
+    corpus = ReportStream(report_file(output_path, input_program, 'jsonl', 'corpus')) if args.inputs else None
+    try:
+        analyze_functions(input_program, module, indices, options, jobs, record_writer(stream, corpus), cache, query_options, query_cache, profiles, deadline)
+    finally:
+        stream.close()
+        if corpus is not None:
+            corpus.close()
+    if query_cache is not None:
+        print('Query cache: ' + query_cache.stats())
 
-    generate_report(results, output_path, input_program)
+    with profile.timer('report'):
+        render(stream_path, args.format, output_path, input_program)
 
-# analysis
-def analyze_program(code_string, function_names, index, py_cfg, max_depth, max_tries, max_iter, check_constant, insert_constant=[]):
-    results = []
-    single_result = {}
-    if insert_constant:
-        r_fn_name = function_names[index] + " (FUNCTION-CALL-WITH-CONSTANT-VARIABLES)" 
+    if args.profile:
+        for fn_profile in profiles.values():
+            profile.merge(fn_profile)
+        profile.add_time('total', time.perf_counter() - start)
+        write_profile(args.profile, input_program, vars(args), profile, profiles)
+
+
+# create AST from source file, with its loops lowered, and index the definition
+# of each fn; the CFG of a function is only built when it is analyzed
+def parse_program(input_program, unroll=UNROLL):
+    astree = lower_loops(astor.parse_file(input_program), unroll)
+    return ModuleIndex([node for node in ast.walk(astree) if isinstance(node, ast.FunctionDef)])
+
+
+# analyze the functions at indices in order, in worker processes when jobs > 1,
+# and pass the report records of each to emit, in function order; functions
+# found in the cache are neither analyzed nor given a CFG. profiles receives
+# the profile of every function, as a dict
+def analyze_functions(input_program, module, indices, options, jobs, emit, cache=None, query_options=(0, None), query_cache=None, profiles=None, deadline=None):
+    function_names = module.names
+    keys = {}
+    analyzed = {}
+    if cache is not None:
+        for i, key in zip(indices, function_keys(module, indices, options)):
+            keys[i] = key
+            entry = cache.load(key)
+            if entry is not None:
+                analyzed[i] = entry
+    # a function reported from the cache is not profiled again
+    cached = Profile()
+    cached.count('cached')
+    fn_profiles = {i: cached.to_dict() for i in analyzed}
+    missing = [i for i in indices if i not in analyzed]
+
+    parallel = None
+    if jobs > 1 and len(missing) > 1:
+        # the functions come back in the order of missing, each as soon as it
+        # and the ones before it are done
+        parallel = analyze_parallel(input_program, missing, options, jobs, query_options, deadline)
+    elif missing:
+        worker_state['program'] = module
+        worker_state['options'] = options
+        worker_state['query_cache'] = query_cache
+        worker_state['deadline'] = deadline
+
+    for i in indices:
+        emit(function_record(function_names[i], module.nodes[i].lineno))
+        if i in analyzed:
+            output, records = analyzed[i]
+        elif parallel is not None:
+            output, records, fn_profiles[i] = next(parallel)
+            # fold the counters of the workers' query caches into the local one
+            if query_cache is not None:
+                query_cache.hits += fn_profiles[i]['counters'].get('query_cache_hits', 0)
+                query_cache.misses += fn_profiles[i]['counters'].get('query_cache_misses', 0)
+        elif cache is None:
+            # without a cache nothing has to be kept, so the output is printed
+            # and the records are written live
+            output, records, fn_profiles[i] = analyze_function(i, capture=False, emit=emit)
+        else:
+            output, records, fn_profiles[i] = analyze_function(i)
+        sys.stdout.write(output)
+        for record in records:
+            emit(record)
+        if profiles is not None:
+            profiles[function_names[i]] = fn_profiles[i]
+        if cache is not None and i in missing and is_decided(records):
+            cache.store(keys[i], (output, records))
+
+
+# ============================ Artifact cache ============================
+# the paths of a function also depend on the functions it is linked with in the
+# CFG (callees and callers), and every result lists the variables of those, so
+# the key covers the whole call graph component and its declarations
+def function_keys(module, indices, options):
+    keys = []
+    for i in indices:
+        name = module.names[i]
+        component = module.component(name)
+        component_sources = [astor.to_source(node) for node in module.nodes if node.name in component]
+        variables = sorted(module.scope(name).items())
+        keys.append(content_key(name, component_sources, variables, options))
+    return keys
+
+
+# ============================ Parallel analysis ============================
+# every worker process parses the input once and keeps its own CFG and z3
+# context; its CFG only holds the functions it analyzes
+worker_state = {}
+
+
+def init_worker(input_program, options, query_options, deadline=None):
+    start = time.perf_counter()
+    worker_state['program'] = parse_program(input_program, options.unroll)
+    worker_state['setup'] = time.perf_counter() - start
+    worker_state['options'] = options
+    worker_state['query_cache'] = make_query_cache(query_options)
+    worker_state['deadline'] = deadline
+
+
+# a function cut short by a budget is analyzed again next time, not cached
+def is_decided(records):
+    return all(r['status'] in {'sat', 'unsat'} for r in records if r['type'] == 'path')
+
+
+# query_options: (size of the in-memory LRU, directory it spills to); size 0 disables it
+def make_query_cache(query_options):
+    size, spill = query_options
+    if size <= 0:
+        return None
+    return QueryCache(size, ArtifactCache(spill) if spill else None)
+
+
+# analyze one function; the console output and the report records are
+# captured so that they can be written in function order and kept in the
+# cache, unless the records are passed to emit. The profile of the function is
+# returned along with them; the time spent parsing the program counts for the
+# first function analyzed on it, the time spent adding a part to the CFG for
+# the function it is added for
+def analyze_function(index, capture=True, emit=None):
+    module = worker_state['program']
+    options = worker_state['options']
+    query_cache = worker_state['query_cache']
+    # one portfolio per process, so that the configurations winning on a
+    # function are tried first on the next
+    portfolio = None
+    if options.portfolio is not None:
+        portfolio = worker_state.setdefault('portfolio', Portfolio(options.portfolio))
+    profile = Profile()
+    profile.add_time('parse', worker_state.pop('setup', 0.0))
+    with profile.timer('cfg'):
+        module.cfg(module.names[index])
+    records = []
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output) if capture else contextlib.nullcontext():
+        print_func(module.names[index])
+        analyze_program(module, index, options.max_depth, options.max_tries, options.max_iter, options.summaries, prune=options.prune, workers=options.workers, query_cache=query_cache, quiet=options.quiet, profile=profile, emit=emit or records.append,
+                        solver_timeout=options.solver_timeout, portfolio=portfolio, simplify=options.simplify, partition=options.partition, function_timeout=options.function_timeout, max_paths=options.max_paths, deadline=worker_state.get('deadline'),
+                        merge=options.merge, search=options.search, inputs=options.inputs, unroll=options.unroll)
+    return output.getvalue(), records, profile.to_dict()
+
+
+def analyze_parallel(input_program, indices, options, jobs, query_options=(0, None), deadline=None):
+    # spawn so that no worker inherits the z3 context or CFG registry of the parent
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(jobs, initializer=init_worker, initargs=(input_program, options, query_options, deadline)) as pool:
+        # imap keeps the order of indices, so the report is unchanged
+        yield from pool.imap(analyze_function, indices)
+
+# ============================ Batch analysis ============================
+# programs whose CFG a batch worker keeps
+BATCH_PROGRAMS = 8
+
+
+# every .py file of the inputs, directories searched recursively and globs
+# expanded, in a stable order
+def discover_files(inputs):
+    files = []
+    for pattern in inputs:
+        matches = sorted(glob.glob(pattern, recursive=True)) if any(c in pattern for c in '*?[') else [pattern]
+        for match in matches:
+            if os.path.isdir(match):
+                for root, dirs, names in os.walk(match):
+                    dirs.sort()
+                    files += [os.path.join(root, name) for name in sorted(names) if name.endswith('.py')]
+            elif match.endswith('.py') and os.path.isfile(match):
+                files.append(match)
+    return list(dict.fromkeys(files))
+
+
+# the module level functions the analysis supports: every parameter annotated
+# with a type it has a z3 sort for, no *args, **kwargs or keyword-only ones
+def is_eligible(node):
+    args = node.args
+    if args.vararg or args.kwarg or args.kwonlyargs or getattr(args, 'posonlyargs', []):
+        return False
+    return all(isinstance(a.annotation, ast.Name) and a.annotation.id in SYM_VARS_STR for a in args.args)
+
+
+# like parse_program, restricted to the eligible functions; calls of the
+# other functions are left unconstrained
+def parse_eligible(input_program, unroll=UNROLL):
+    astree = lower_loops(astor.parse_file(input_program), unroll)
+    return ModuleIndex([node for node in astree.body if isinstance(node, ast.FunctionDef) and is_eligible(node)])
+
+
+# the work items are scheduled largest first, so that a big function does not
+# start last; branches multiply the paths, so they count first
+def function_size(node):
+    nodes = list(ast.walk(node))
+    return len([n for n in nodes if isinstance(n, (ast.If, ast.While, ast.For, ast.IfExp, ast.BoolOp))]), len(nodes)
+
+
+def init_batch_worker(options, query_options, deadline):
+    worker_state['options'] = options
+    worker_state['query_cache'] = make_query_cache(query_options)
+    worker_state['deadline'] = deadline
+    worker_state['programs'] = collections.OrderedDict()
+
+
+# make input_program the program of this worker, from the last BATCH_PROGRAMS
+# when possible; a program keeps its CFG and summaries
+def load_batch_program(input_program):
+    programs = worker_state['programs']
+    if input_program not in programs:
+        start = time.perf_counter()
+        programs[input_program] = parse_eligible(input_program, worker_state['options'].unroll)
+        worker_state['setup'] = time.perf_counter() - start
+        if len(programs) > BATCH_PROGRAMS:
+            programs.popitem(last=False)
+    programs.move_to_end(input_program)
+    worker_state['program'] = programs[input_program]
+
+
+# analyze one (file, function index) item; a function the analysis fails on
+# is reported as an error instead of stopping the batch
+def analyze_batch_item(item):
+    input_program, index = item
+    start = time.perf_counter()
+    try:
+        load_batch_program(input_program)
+        output, records, profile = analyze_function(index)
+        error = None
+    except Exception as e:
+        output, records, profile = '', [], Profile().to_dict()
+        error = '%s: %s' % (type(e).__name__, e)
+        # summaries and the CFG may be left half computed
+        worker_state['programs'].pop(input_program, None)
+    return output, records, profile, error, time.perf_counter() - start
+
+
+def analyze_batch_items(items, jobs, options, query_options, deadline):
+    if jobs > 1:
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(jobs, initializer=init_batch_worker, initargs=(options, query_options, deadline)) as pool:
+            # one item at a time, so that the largest items are spread over the workers
+            yield from zip(items, pool.imap(analyze_batch_item, items, chunksize=1))
     else:
-        r_fn_name = function_names[index]
+        init_batch_worker(options, query_options, deadline)
+        for item in items:
+            yield item, analyze_batch_item(item)
+
+
+# analyze every eligible function of every file found in inputs, largest first,
+# into one report stream <output>/batch_report.jsonl plus a summary of every
+# file in <output>/batch_summary.json; generated inputs go to <output>/batch_corpus.jsonl
+def analyze_batch(inputs, output_path, selected_function_name, options, jobs, cache, query_options, report_format, profile_path, deadline=None):
+    start = time.perf_counter()
+    files = discover_files(inputs)
+    file_summaries = {}
+    items = []
+    cached = {}
+    keys = {}
+    for input_program in files:
+        file_summary = file_summaries[input_program] = {'functions': 0, 'cached': 0, 'paths': 0, 'unsat': 0, 'unknown': 0, 'unexplored': 0, 'errors': {}, 'time': 0.0}
+        try:
+            module = parse_eligible(input_program, options.unroll)
+        except (SyntaxError, UnicodeDecodeError, ValueError) as e:
+            file_summary['errors']['*parse*'] = '%s: %s' % (type(e).__name__, e)
+            continue
+        function_nodes = module.nodes
+        indices = [i for i, node in enumerate(function_nodes)
+                   if selected_function_name is None or node.name == selected_function_name]
+        file_summary['functions'] = len(indices)
+        if cache is not None:
+            for i, key in zip(indices, function_keys(module, indices, options)):
+                keys[input_program, i] = key
+                entry = cache.load(key)
+                if entry is not None:
+                    cached[input_program, i] = entry
+        items += [((input_program, i), function_size(function_nodes[i]), function_nodes[i])
+                  for i in indices]
+    nodes = {item: node for item, _, node in items}
+    # sorted is stable, so items of the same size keep the file order
+    items = [item for item, _, _ in sorted(items, key=lambda i: i[1], reverse=True)]
+    missing = [item for item in items if item not in cached]
+    print('Batch: %d files, %d functions, %d from the cache' % (len(files), len(items), len(items) - len(missing)))
+
+    profile = Profile()
+    profiles = {}
+    stream_path = report_file(output_path, 'batch', 'jsonl')
+    stream = ReportStream(stream_path)
+    corpus = ReportStream(report_file(output_path, 'batch', 'jsonl', 'corpus')) if options.inputs else None
+    write = record_writer(stream, corpus)
+    try:
+        analyzed = itertools.chain(((item, cached[item] + (Profile().to_dict(), None, 0.0)) for item in items if item in cached),
+                                   analyze_batch_items(missing, jobs, options, query_options, deadline))
+        for done, (item, (output, records, fn_profile, error, seconds)) in enumerate(analyzed):
+            input_program, index = item
+            node = nodes[item]
+            file_summary = file_summaries[input_program]
+            file_summary['time'] += seconds
+            stream.write(dict(function_record(node.name, node.lineno), file=input_program))
+            for record in records:
+                record['file'] = input_program
+                write(record)
+            paths = [r for r in records if r['type'] == 'path']
+            statuses = collections.Counter(r['status'] for r in paths)
+            file_summary['paths'] += len(paths)
+            for status in ('unsat', 'unknown', 'unexplored'):
+                file_summary[status] += statuses[status]
+            if item in cached:
+                file_summary['cached'] += 1
+            elif error is not None:
+                file_summary['errors'][node.name] = error
+            elif cache is not None and is_decided(records):
+                cache.store(keys[item], (output, records))
+            profiles['%s:%s' % (input_program, node.name)] = fn_profile
+            undecided = ', %d unknown, %d unexplored' % (statuses['unknown'], statuses['unexplored']) if not is_decided(records) else ''
+            print('[%d/%d] %s:%s: %s' % (done + 1, len(items), input_program, node.name,
+                                         error or '%d paths, %d unsat%s (%.2fs)' % (len(paths), statuses['unsat'], undecided, seconds)))
+    finally:
+        stream.close()
+        if corpus is not None:
+            corpus.close()
+
+    with open(os.path.join(output_path, 'batch_summary.json'), 'w') as f:
+        json.dump(file_summaries, f, indent=2)
+    for input_program, file_summary in file_summaries.items():
+        print('%s: %d functions, %d paths, %d unsat, %d unknown, %d unexplored, %d errors' % (
+            input_program, file_summary['functions'], file_summary['paths'], file_summary['unsat'],
+            file_summary['unknown'], file_summary['unexplored'], len(file_summary['errors'])))
+    with profile.timer('report'):
+        render(stream_path, report_format, output_path, 'batch')
+    if profile_path:
+        for fn_profile in profiles.values():
+            profile.merge(fn_profile)
+        profile.add_time('total', time.perf_counter() - start)
+        write_profile(profile_path, 'batch', {'inputs': inputs, 'options': options._asdict()}, profile, profiles)
 
-    single_result[r_fn_name] = []
 
-    asymfz_ct = AdvancedSymbolicFuzzer(code_string, function_names, index, py_cfg,\
-                max_depth=max_depth, max_tries=max_tries, max_iter=max_iter)
+# analysis
+# the report record of every path is passed to emit. The analysis stops at
+# function_timeout seconds, at max_paths paths or at the deadline of the run,
+# whichever comes first; the paths it did not get to are still reported
+def analyze_program(module, index, max_depth, max_tries, max_iter, summaries, prune=False, workers=1, query_cache=None, quiet=False, profile=None, emit=None,
+                    solver_timeout=None, function_timeout=None, max_paths=None, deadline=None, merge=0, search='bfs', inputs=0, unroll=UNROLL, portfolio=None, simplify=True, partition=True):
+    if function_timeout is not None:
+        deadline = min(deadline or float('inf'), time.time() + function_timeout)
+    function_names = module.names
+    asymfz_ct = AdvancedSymbolicFuzzer(module, function_names[index],\
+                max_depth=max_depth, max_tries=max_tries, max_iter=max_iter, prune=prune, query_cache=query_cache, quiet=quiet, profile=profile,
+                deadline=deadline, max_paths=max_paths, solver_timeout=solver_timeout, portfolio=portfolio, simplify=simplify, partition=partition, merge=merge, search=search, inputs=inputs, unroll=unroll)
+    profile = asymfz_ct.profile
     # print(asymfz_ct.used_variables)
-    # print("code_String", code_string)
-    paths = asymfz_ct.get_all_paths(asymfz_ct.fnenter)
 
+    # paths are solved and reported as they are generated; with several workers
+    # they are solved in batches, in isolation, otherwise each path is solved
+    # on the fuzzer's own solver
+    pending = []
     num_of_paths = 0
-    used_constraint = []
-    functions_with_constant = {}
-    for i in range(len(paths)):
-        # print("i======", i)
-        constraint = asymfz_ct.extract_constraints(paths[i].get_path_to_root())
-        constraint_key = '__'.join(constraint)
-        if constraint_key in used_constraint or len(constraint) < 2:
+    for path in profile.timed('paths', asymfz_ct.iter_paths(asymfz_ct.fnenter)):
+        constraint = prepare_path(asymfz_ct, path.get_path_to_root(), function_names, summaries)
+        if constraint is None:
+            profile.count('paths_trivial')
             continue
+        pending.append((constraint, path.get_path_to_root()))
+        if len(pending) >= workers * PATH_BATCH or workers == 1:
+            num_of_paths = report_paths(asymfz_ct, pending, workers, emit, num_of_paths)
+            pending = []
+    num_of_paths = report_paths(asymfz_ct, pending, workers, emit, num_of_paths)
+    profile.count('paths_reported', num_of_paths)
+    report_unexplored(asymfz_ct, emit, num_of_paths)
+
+
+# the path prefixes the fuzzer did not get to explore before a budget ran out
+def report_unexplored(asymfz_ct, emit, num_of_paths):
+    if not asymfz_ct.unexplored:
+        return
+    print('Budget exhausted: %d path prefixes left unexplored' % len(asymfz_ct.unexplored))
+    asymfz_ct.profile.count('paths_unexplored', len(asymfz_ct.unexplored))
+    for path in asymfz_ct.unexplored:
         num_of_paths += 1
-        print('\n ---------------------------------------- path: ' + str(num_of_paths)+ ' ---------------------------------------- ')
-        used_constraint.append(constraint_key)
-        # print(constraint)
-        constraint, function_with_constant = ConstantDetector.check_function_call(constraint, function_names)
-        if insert_constant:
-            constraint = generate_constraint_constant(insert_constant, constraint)
-        if check_constant:
-            functions_with_constant.update(function_with_constant)
-        # constraints
-        constraint = clean_constraint(constraint, function_names)
-        print('Contraint Path: ', constraint)
-        # if asymfz_ct.solve_constraint(constraint, paths[i].get_path_to_root()):
-        solved_args, unsat = asymfz_ct.solve_constraint(constraint, paths[i].get_path_to_root())
-        solved_args['*constraint*'] = constraint
-        if insert_constant:
-            solved_args['*constant*'] = insert_constant
-        single_result[r_fn_name].append(solved_args)
-        if unsat:
-            # print('Contraint Arguments (UNSAT): ', solved_args)
-            continue
-        else:
-            print('Contraint Arguments: ', solved_args)
-    results.append(single_result)
-    
+        constraint = clean_constraint(path.get_path_predicates()[0], asymfz_ct.function_names)
+        if emit is not None:
+            emit({'type': 'path', 'function': asymfz_ct.fn_name, 'path': num_of_paths,
+                  'status': 'unexplored', 'constraints': render_constraints(constraint)})
+
+
+# constraints of a path ready to be solved, None for trivial paths; duplicate
+# paths are already dropped by the fuzzer
+def prepare_path(asymfz_ct, path, function_names, summaries):
+    with asymfz_ct.profile.timer('ssa'):
+        constraint = asymfz_ct.extract_constraints(path)
+    if len(constraint) < 2:
+        return None
+    # calls of summarized functions are replaced by the callee's summary;
+    # the remaining calls are dropped
+    if summaries:
+        constraint = asymfz_ct.instantiate_calls(constraint)
+    constraint, _ = ConstantDetector.check_function_call(constraint, function_names)
+    return clean_constraint(constraint, function_names)
 
-    if check_constant:
-        print(check_constant)
-        print('########################## RE-CHECK FUNCTION CALL WITH CONSTANT VALUES ########################## ')
-        results += recheck_func_with_constant(functions_with_constant, code_string,\
-                                function_names, index, py_cfg, max_depth, max_tries, max_iter)
 
-    return results
+# solve and report a list of (constraints, path); returns the number of paths reported so far
+def report_paths(asymfz_ct, checked_paths, workers, emit, num_of_paths):
+    outcomes = [None] * len(checked_paths)
+    if workers > 1:
+        # paths under a known unsat core are not sent to the solver
+        unknown = [i for i, (_, path) in enumerate(checked_paths) if asymfz_ct.known_core(path) is None]
+        solved = asymfz_ct.solve_paths([checked_paths[i][0] for i in unknown], workers)
+        for i, outcome in zip(unknown, solved):
+            outcomes[i] = outcome
+
+    for (constraint, path), outcome in zip(checked_paths, outcomes):
+        num_of_paths += 1
+        asymfz_ct.log('\n ---------------------------------------- path: ' + str(num_of_paths)+ ' ---------------------------------------- ')
+        asymfz_ct.log('Contraint Path: ', constraint)
+        # if asymfz_ct.solve_constraint(constraint, paths[i].get_path_to_root()):
+        solved_args, status = asymfz_ct.solve_constraint(constraint, path, outcome, num_of_paths)
+        record = {'type': 'path', 'function': asymfz_ct.fn_name, 'path': num_of_paths,
+                  'status': status, 'constraints': render_constraints(constraint)}
+        if status == 'sat':
+            asymfz_ct.log('Contraint Arguments: ', {**solved_args, '*constraint*': record['constraints']})
+            # z3 values belong to the solver's context; the report only needs their text
+            record['arguments'] = {k: None if v is None else str(v) for k, v in solved_args.items()}
+        else:
+            record.update(solved_args)
+        if emit is not None:
+            emit(record)
+        if status == 'sat' and asymfz_ct.inputs:
+            # seeded by the path number, so every run generates the same corpus
+            with asymfz_ct.profile.timer('inputs'):
+                inputs = asymfz_ct.generate_inputs(constraint, asymfz_ct.inputs, num_of_paths)
+            asymfz_ct.log('Generated inputs: ', len(inputs))
+            if emit is not None:
+                for values in inputs:
+                    emit({'type': 'input', 'function': asymfz_ct.fn_name, 'path': num_of_paths, 'inputs': values})
+    return num_of_paths
 
 
-# we assume for loop as one time iteration
+# loops over constant ranges are lowered before the CFG is built; the iterator
+# of any other for loop is left unconstrained. Returned values only matter to summaries
 def clean_constraint(constraint, function_names):
     new_contraint = []
 
     for i, ct in enumerate(constraint):
         # remove for loop 
-        if '__for_' in ct:
-            continue
-        elif 'iter(range(' in ct:
-            continue
-        elif '== next(_' in ct:
+        if ct.kind in {LOOP, RETURN}:
             continue
         else:
             new_contraint.append(ct)
     return new_contraint
 
 
-# re-check some functions which with constant input argument values
-def recheck_func_with_constant(functions_with_constant, code_string,\
-                            function_names, index, py_cfg, max_depth, max_tries, max_iter):
-    results = []
-    for fc_name_key in functions_with_constant:
-        fc_name = fc_name_key.split('**')[0]
-        arg_values = functions_with_constant[fc_name_key]
-        insert_constant = []
-        print("########################## ", fc_name, arg_values)
-        for index, fn_name in enumerate(function_names):
-            if fn_name == fc_name:
-                results += analyze_program(code_string, function_names, index, py_cfg,
-                        max_depth, max_tries, max_iter, False, insert_constant=arg_values)
-    return results    
-
-
-# generate additional consraints for constant values
-def generate_constraint_constant(insert_constant, constraint):
-    constraint_args = constraint[0]
-    if 'z3.And(' in constraint_args:
-        args = constraint_args.split('(')[1].split(')')[0].split(',')
-        if len(args) != len(insert_constant):
-            print('args length does not match', args, insert_constant)
-            return constraint
-        for i, (x, y) in enumerate(zip(args, insert_constant)):
-            if y != 'unknown':
-                renamed_variable = x.split('==')[-1].strip()
-                if is_constant_assigned(renamed_variable, constraint):
-                    continue
-                temp = renamed_variable + ' == ' + str(y)
-                constraint.insert(1, temp)
-    return constraint
-
-
-# a variable can be assigned with constant value
-def is_constant_assigned(renamed_variable, constraint):
-    for c in constraint:
-        if ' == ' in c:
-            if ConstantDetector.is_number(c.split(' == ')[-1]):
-                return True
-    return False
+# profile of the whole run and of every function as JSON; timers are in seconds
+def write_profile(path, input_program, args, profile, profiles):
+    with open(path, 'w') as f:
+        json.dump({'program': input_program,
+                   'options': {k: v for k, v in args.items() if k not in {'input', 'output', 'profile'}},
+                   'run': profile.to_dict(),
+                   'functions': profiles}, f, indent=2)
+    print('Profile written to ' + path)
 
 
 # print function name
@@ -184,81 +558,38 @@ def print_func(s):
     print('############################################################################################### ')
 
 
-# generate a report for UNSAT constraint path
-def generate_report(results, output_path, input_program):
-    if platform.system() == "Windows":
-        filename = input_program.split('\\')[-1]
-        filename = output_path + '\\' + filename + '_report.txt'
-    else:
-        filename = input_program.split('/')[-1]
-        filename = output_path + '/' + filename + '_report.txt'
-
-    with open(filename, 'w+') as f: 
-        f.write('===========================================================================\n')
-        f.write('===================== UNSAT PATH REPORT START =============================\n')
-        f.write('===========================================================================\n\n')
-        for result in results:
-            for fn_name in result:
-                if result[fn_name]:
-                    f.write('\n################ FUNCTION NAME: ' + fn_name +  ' ################\n')
-                    for elements in result[fn_name]:
-                        if '*core*' in elements:
-                            f.write("\n================== ERROR: UNSAT PATH FOUND ===================\n")
-                            if '*constant*' in elements:
-                                f.write('------ constraint values: \n')
-                                f.write( 'Variables: ' + ', '.join(elements['*constant*'])+ '\n')
-                            break_point = 0
-                            f.write('------ constraint path: \n')
-                            for s in elements['*con*']:
-                                f.write('\t' + s + '\n')
-                            f.write('------ unsat core: \n')
-                            for s in elements['*core*']:
-                                f.write(s + '\n')
-                                break_point += 1
-                            count = 0
-                            f.write('------ statement: \n')
-                            for s in elements['*statement*']:
-                                count += 1
-                                if count >= break_point:
-                                    break
-                                f.write(s + '\n')
-                            f.write('==============================================================\n\n')
-                    f.write('\n' + '#' * (len(fn_name)+48) +  '\n')
-
-    with open(filename, 'a+') as f: 
-        f.write('\n\n===========================================================================\n')
-        f.write('===================== OTHER SATISIED PATH CHECKED =========================\n')
-        f.write('===========================================================================\n\n')
-        for result in results:
-            for fn_name in result:
-                if result[fn_name]:
-                    f.write('\n################ FUNCTION NAME: ' + fn_name +  ' ################\n')
-                    for elements in result[fn_name]:
-                        if '*core*' not in elements:
-                            for e_key in elements:
-                                # ss = dict(elements[e_key])
-                                if e_key == '*constraint*':
-                                    f.write('============ Contraint Path ============\n')
-                                    for s in elements['*constraint*']:
-                                        f.write(s + '\n') 
-                                    f.write('========================================\n\n')
-                                else:
-                                    f.write( str(e_key) + ": " + str(elements[e_key]) + '\n')
-
-                    f.write('\n' + '#' * (len(fn_name)+48) +  '\n')
-
 # main 
 if __name__ == "__main__":
     # ============================ Arguments ============================
     parser = argparse.ArgumentParser(description='Argument parser')
     # ============== required arguments ==============
-    parser.add_argument("-i", "--input", help="input program path", type=str, required=True)
+    parser.add_argument("-i", "--input", help="input program path; several files, directories or globs are analyzed as one batch", type=str, nargs='+', required=True)
     # ============== optional arguments ==============
     parser.add_argument("-o", "--output", help="output path for report", type=str, default="reports/")
     parser.add_argument("-d", "--depth", help="max depth", type=int, default=10)
     parser.add_argument("-t", "--tries", help="max tries", type=int, default=10)
     parser.add_argument("-r", "--iter", help="max iterations", type=int, default=10)
     parser.add_argument("-f", "--func", help="specify function name", type=str, default=None)
-    parser.add_argument("-c", "--constant", help="re-check function if constant detected (0: False - 1: True (default))", type=int, default=1)
+    parser.add_argument("-c", "--constant", help="instantiate summaries of the called functions at call sites, so that constant arguments reach the callee (0: False - 1: True (default))", type=int, default=1)
+    parser.add_argument("-j", "--jobs", help="number of worker processes analyzing functions in parallel", type=int, default=1)
+    parser.add_argument("-w", "--workers", help="number of solver threads per function, each with its own z3 context", type=int, default=1)
+    parser.add_argument("--cache", help="directory of the on-disk cache of analyzed functions (disabled by default)", type=str, default=None)
+    parser.add_argument("-q", "--query-cache", help="number of solver answers kept in the in-memory query cache (0: disabled (default))", type=int, default=0)
+    parser.add_argument("--query-spill", help="directory that answers evicted from the query cache are spilled to", type=str, default=None)
+    parser.add_argument("-p", "--prune", help="prune infeasible path prefixes while exploring (0: False (default) - 1: True)", type=int, default=0)
+    parser.add_argument("--profile", help="write the time of every phase and the counters of the run and of every function as JSON to this path", type=str, default=None)
+    parser.add_argument("--solver-timeout", help="milliseconds a solver query may take; the path is reported as unknown when it does not finish (unbounded by default)", type=int, default=None)
+    parser.add_argument("--portfolio", help="milliseconds a solver query may take before every z3 configuration of the portfolio races on it, the first answer winning; the configuration winning most often gets the queries first (disabled by default)", type=int, default=None)
+    parser.add_argument("--simplify", help="propagate constants and copies, fold literals and drop unused definitions before a path is solved (0: False - 1: True (default))", type=int, default=1)
+    parser.add_argument("--partition", help="solve the clusters of a path that share no variable one at a time and cache their answers (0: False - 1: True (default))", type=int, default=1)
+    parser.add_argument("--function-timeout", help="seconds the analysis of a function may take (unbounded by default)", type=float, default=None)
+    parser.add_argument("--max-paths", help="paths generated per function at most (unbounded by default)", type=int, default=None)
+    parser.add_argument("--deadline", help="seconds the whole run may take; functions not finished by then report what they have (unbounded by default)", type=float, default=None)
+    parser.add_argument("-s", "--search", help="order in which the paths are explored: breadth first, depth first, random path, shortest distance to an uncovered branch or unsat first (default: bfs)", choices=list(SEARCH_STRATEGIES), default='bfs')
+    parser.add_argument("-m", "--merge", help="merge the two sides of a conditional where they join, into z3.If values, when both only assign values in at most MERGE statements together (0: split every path (default))", type=int, default=0)
+    parser.add_argument("-n", "--inputs", help="distinct inputs generated per sat path into the corpus <input>_corpus.jsonl (0: none (default))", type=int, default=0)
+    parser.add_argument("-k", "--unroll", help="iterations of a for loop over a constant range that are unrolled, and times a path goes around any other loop, at most (default: %d)" % UNROLL, type=int, default=UNROLL)
+    parser.add_argument("--format", help="format of the report rendered from the JSON Lines stream <input>_report.jsonl that is always written (default: text)", choices=REPORT_FORMATS, default='text')
+    parser.add_argument("--quiet", help="do not print the constraints and results of every path", action="store_true")
     args = parser.parse_args()
     main(args)
\ No newline at end of file
@@ -0,0 +1,302 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+EXAMPLES = os.path.join(ROOT, 'examples')
+SAMPLES = sorted(f for f in os.listdir(EXAMPLES) if f.endswith('.py') and f != '__init__.py')
+
+
+# the path records of run.py on the program at path, with the extra arguments
+def run_records(path, *args):
+    with tempfile.TemporaryDirectory() as output:
+        subprocess.run([sys.executable, 'run.py', '-i', path, '-o', output, '--quiet'] + list(args),
+                       cwd=SRC, check=True, stdout=subprocess.DEVNULL)
+        with open(os.path.join(output, os.path.basename(path) + '_report.jsonl')) as f:
+            return [r for r in map(json.loads, f) if r['type'] == 'path']
+
+
+def path_records(example, *args):
+    return run_records(os.path.join(EXAMPLES, example), *args)
+
+
+# the path records of run.py on the program in source
+def program_records(source, *args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'program.py')
+        with open(path, 'w') as f:
+            f.write(source)
+        return run_records(path, *args)
+
+
+# the lines the unsat paths of each function end at, the last line of their core
+def unsat_lines(records):
+    return sorted({(r['function'], r['core'][-1]['line']) for r in records if r['status'] == 'unsat'})
+
+
+# the counters of the profile of run.py on the program in source
+def program_counters(source, *args):
+    with tempfile.TemporaryDirectory() as directory:
+        profile = os.path.join(directory, 'profile.json')
+        program_records(source, '--profile', profile, *args)
+        with open(profile) as f:
+            return json.load(f)['run']['counters']
+
+
+# everything a report says about its paths but the inputs the solver picked
+def findings(records):
+    return sorted((r['function'], r['status'], r['constraints'], json.dumps(r.get('core'))) for r in records)
+
+
+def sat_functions(records):
+    return sorted({r['function'] for r in records if r['status'] == 'sat'})
+
+
+def statuses(records, function):
+    return sorted((r['status'], tuple(r['constraints'])) for r in records if r['function'] == function)
+
+
+class PruneTest(unittest.TestCase):
+
+    # the summary of a callee keeps its return value when the callee was
+    # explored in prune mode, so the caller paths its return rules out are
+    # unsat either way. Pruning reports an unsat prefix of func_b once instead
+    # of once per path below it, so only func_a compares path for path
+    def test_function_call_summaries(self):
+        plain = path_records('function_call.py', '-p', '0')
+        pruned = path_records('function_call.py', '-p', '1')
+        self.assertEqual(statuses(plain, 'func_a'), statuses(pruned, 'func_a'))
+        self.assertEqual([r['status'] for r in pruned if r['function'] == 'func_a'].count('unsat'), 2)
+        sat = [sorted(r['constraints'] for r in records if r['status'] == 'sat') for records in (plain, pruned)]
+        self.assertEqual(sat[0], sat[1])
+
+
+INDEPENDENT = '''def independent(a0: int, a1: int):
+    if a0 > 0:
+        a0 = 0
+    if a1 > 1:
+        a1 = 1
+    if a1 > 1:
+        return -1
+    return 0
+'''
+
+SEQUENCE = '''def sequence(a0: int, a1: int):
+    s: int = 0
+    if a0 > 0:
+        s = s + 1
+    else:
+        s = s - 1
+    if a1 > 1:
+        s = s + 1
+    else:
+        s = s - 1
+    if s > 2:
+        return -1
+    return s
+'''
+
+
+class MergeTest(unittest.TestCase):
+
+    # a prefix pruned below a merged conditional keeps its merge region, so
+    # its unsat path is still reported when pruning and merging are combined
+    def test_prune_with_merge(self):
+        for function, source in (('independent', INDEPENDENT), ('sequence', SEQUENCE)):
+            pruned = program_records(source, '-p', '1')
+            merged = program_records(source, '-p', '1', '-m', '8')
+            self.assertTrue(unsat_lines(pruned))
+            self.assertEqual(unsat_lines(pruned), unsat_lines(merged))
+            self.assertEqual(statuses(merged, function), statuses(program_records(source, '-m', '8'), function))
+
+    # a merged path stands for the paths it joins: it is unsat where they are
+    # and every function keeps a sat path, with pruning or without
+    def test_samples(self):
+        for example in SAMPLES:
+            for prune in ('0', '1'):
+                plain = path_records(example, '-p', prune)
+                merged = path_records(example, '-p', prune, '-m', '8')
+                self.assertEqual(unsat_lines(plain), unsat_lines(merged), (example, prune))
+                self.assertEqual(sat_functions(plain), sat_functions(merged), (example, prune))
+
+
+CALLERS = '''def fb(x: int):
+    if x > 0:
+        return True
+    return False
+
+
+def fa(a: int):
+    if fb(a):
+        return 1
+    return 0
+
+
+def fc(c: int):
+    if fb(c):
+        return 2
+    return 0
+
+
+def fd(d: int):
+    if fb(d):
+        return 3
+    return 0
+'''
+
+
+class ComponentTest(unittest.TestCase):
+
+    # every call of a component of more than two functions is linked once, so
+    # the exit of the callee is not linked back into its own entry
+    def test_callee_of_three_callers(self):
+        records = program_records(CALLERS)
+        self.assertEqual([r['status'] for r in records if r['function'] == 'fb'], ['sat', 'sat'])
+        for caller in ('fa', 'fc', 'fd'):
+            self.assertEqual([r['status'] for r in records if r['function'] == caller], ['sat', 'sat'])
+
+
+DIVISION = '''def half(a: int):
+    if a / 2 == 1.5:
+        return 1
+    return 0
+'''
+
+
+class DivisionTest(unittest.TestCase):
+
+    # / is true division on ints, as in Python: a = 3 reaches the branch
+    def test_true_division(self):
+        records = program_records(DIVISION)
+        self.assertEqual([r['status'] for r in records], ['sat', 'sat'])
+        self.assertEqual(records[0]['arguments'], {'a': '3'})
+
+
+class SimplifyTest(unittest.TestCase):
+
+    # a simplified query is sat or unsat where the path is, and its core is
+    # traced back to the constraints of the path
+    def test_samples(self):
+        for example in SAMPLES:
+            self.assertEqual(findings(path_records(example)), findings(path_records(example, '--simplify', '0')), example)
+        for source in (INDEPENDENT, SEQUENCE):
+            self.assertEqual(findings(program_records(source)), findings(program_records(source, '--simplify', '0')))
+
+    # s is a literal on every path of sequence, so every path folds
+    def test_folded(self):
+        simplified = program_counters(SEQUENCE)
+        plain = program_counters(SEQUENCE, '--simplify', '0')
+        self.assertEqual(simplified['paths_folded'], 4)
+        self.assertGreater(simplified['constraints_dropped'], 0)
+        self.assertLess(simplified['solver_calls'], plain['solver_calls'])
+
+
+WIDE = '''def independent(a0: int, a1: int, a2: int, a3: int):
+    if a0 > 0:
+        a0 = 0
+    if a1 > 1:
+        a1 = 1
+    if a2 > 2:
+        a2 = 2
+    if a3 > 3:
+        a3 = 3
+    if a3 > 3:
+        return -1
+    return 0
+'''
+
+
+class PartitionTest(unittest.TestCase):
+
+    # solving the independent clusters of a query apart, caching their
+    # answers, solving batches of paths on workers or caching the queries
+    # across functions does not change what is reported
+    def test_samples(self):
+        for example in SAMPLES:
+            expected = findings(path_records(example, '--partition', '0'))
+            for args in (('--partition', '1'), ('--simplify', '0'), ('-j', '2'), ('-w', '2'), ('-q', '1000')):
+                self.assertEqual(expected, findings(path_records(example, *args)), (example, args))
+
+    # the parameters are bound apart even unsimplified, so the clusters of a
+    # parameter are solved once for the paths that share them
+    def test_cluster_answers(self):
+        partitioned = program_counters(WIDE, '--simplify', '0')
+        plain = program_counters(WIDE, '--simplify', '0', '--partition', '0')
+        self.assertGreater(partitioned['cluster_cache_hits'], 0)
+        self.assertLess(partitioned['solver_calls'], plain['solver_calls'])
+        self.assertEqual(findings(program_records(WIDE, '--simplify', '0')),
+                         findings(program_records(WIDE, '--simplify', '0', '--partition', '0')))
+
+
+LOOPS = '''def closed(a: int):
+    s: int = 0
+    for i in range(100000000):
+        s += i
+    if s != 4999999950000000:
+        return -1
+    return a
+
+
+def unrolled(a: int):
+    c: int = 0
+    for i in range(3):
+        if a > i:
+            c = c + 1
+    if c > 3:
+        return -1
+    return c
+
+
+def factor(a: int):
+    p: int = 1
+    for i in range(5000):
+        p *= 2
+    if p > a:
+        return 1
+    return 0
+
+
+def bounded(a: int):
+    while a > 0:
+        a = a - 1
+    return a
+'''
+
+
+class LoopTest(unittest.TestCase):
+
+    # a sum over a range of 10 ** 8 values is one closed form, exact
+    def test_closed_form(self):
+        records = program_records(LOOPS, '-f', 'closed')
+        self.assertEqual([r['status'] for r in records], ['unsat', 'sat'])
+        self.assertEqual(unsat_lines(records), [('closed', 5)])
+        self.assertIn('_s_1 == _s_0 + 4999999950000000', records[1]['constraints'])
+
+    # c counts at most the 3 iterations, whether the loop is unrolled or
+    # left to the path exploration
+    def test_unrolled(self):
+        for unroll in ('1', '2', '4'):
+            records = program_records(LOOPS, '-f', 'unrolled', '-r', '30', '-k', unroll)
+            self.assertIn(('unrolled', 15), unsat_lines(records))
+            self.assertFalse([r for r in records if r['status'] == 'sat' and r['constraints'][-1].startswith('(_c_')])
+
+    # 2 ** 5000 takes more bits than a closed form may, the loop is explored
+    def test_factor_limit(self):
+        records = program_records(LOOPS, '-f', 'factor')
+        self.assertTrue(all(len(c) < 100 for r in records for c in r['constraints']))
+        self.assertIn('_p_1 == _p_0 * 2', records[-1]['constraints'])
+        self.assertEqual(set(r['status'] for r in records), {'sat'})
+
+    # a path goes around a while loop at most unroll times
+    def test_unroll_bound(self):
+        for unroll in (1, 3):
+            records = program_records(LOOPS, '-f', 'bounded', '-k', str(unroll))
+            self.assertEqual([r['status'] for r in records], ['sat'] * (unroll + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()